@@ -0,0 +1,183 @@
+"""
+Fuzz of the fast parsing passes against the straightforward ones they replace, run with:
+    python benchmarks/fuzz.py {incremental,optimizer,parser} [--cases 100000] [--seed 0]
+"""
+
+import argparse
+import os
+import random
+import sys
+from typing import Any, Callable, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+import numpy
+from eq import optimizer, parser
+
+# Definitions of the variables of the fuzzed expressions, b2 is 0 to divide by it
+DEFINITIONS = ('a: 2', 'b2: a - 2')
+
+# Values of x where the optimized and the original expressions are compared
+X_VALUES = (-2, -0.5, 0.0, 0.5, 3)
+
+# Pieces of the random token soups, most of them are invalid sentences
+PIECES = ('x', 'y', 'a', 'b2', '0', '2', '10', '0.5', '3.', '+', '-', '*', '/', '^', \
+          '(', ')', ',', ':', '=', '<', '<=', '>=', '>', ' ', '!')
+
+def expression(generator: random.Random, depth: int) -> str:
+    """Create a valid nested expression"""
+
+    if depth == 0 or generator.random() < 0.2:
+        return generator.choice(('x', 'a', 'b2', '0', '2', '10', '0.5', '3.'))
+
+    if generator.random() < 0.15:
+        return generator.choice(('-', '+')) + expression(generator, depth - 1)
+
+    left, right = expression(generator, depth - 1), expression(generator, depth - 1)
+    operator = generator.choice(('+', '-', '*', '/', '^', ' + ', ' ^ '))
+
+    if generator.random() < 0.4:
+        return f'({left}{operator}{right})'
+    return left + operator + right
+
+def make_sentence(generator: random.Random) -> str:
+    """Create a random sentence: a token soup, or one of the valid kinds of sentences"""
+
+    if generator.random() < 0.4:
+        return ''.join(generator.choices(PIECES, k=generator.randrange(1, 20)))
+
+    depth = generator.randrange(1, 6)
+    first, second = expression(generator, depth), expression(generator, depth)
+
+    return generator.choice((first, f'y: {first}', f'a: {first}', f'({first}, {second})', \
+                             f'{first} = {second}', f'{first} <= {second}'))
+
+def shape(node: parser.GenericNode, positions: bool=True) -> Tuple:
+    """Get the node as nested comparable tuples, with the tokens and their positions"""
+
+    tokens = tuple((token.type, token.value) + \
+                   ((token.position, token.length) if positions else ()) \
+                   for attribute in ('token', 'operator', 'name') \
+                   for token in (getattr(node, attribute, None),) if token is not None)
+
+    return (type(node).__name__, tokens, \
+            tuple(shape(child, positions) for child in node.children()))
+
+def outcome(function: Callable[[], Any]) -> Any:
+    """Get the result of function, or the type and the message of its error"""
+
+    try:
+        return function()
+    except Exception as error: # pylint: disable=broad-except
+        return (type(error).__name__, str(error))
+
+def full_parse(sentence: str) -> Tuple:
+    """Get the shape of sentence parsed from scratch"""
+
+    return shape(parser.PrattParser(parser.Lexer(sentence).make_tokens()).parse_sentence())
+
+def fuzz_parser(generator: random.Random, case: int) -> None:
+    """Parse a sentence with PrattParser and with the recursive Parser"""
+
+    sentence = make_sentence(generator)
+    results = [outcome(lambda cls=cls: shape(cls(parser.Lexer(sentence).make_tokens()) \
+                                             .parse_sentence())) \
+               for cls in (parser.PrattParser, parser.Parser)]
+
+    if results[0] != results[1]:
+        raise AssertionError(f'Case {case}: PrattParser differs from Parser in {sentence!r}')
+
+def fuzz_incremental(generator: random.Random, case: int) -> None:
+    """
+    Edit a sentence char ranges at a time, reparsing it with IncrementalParser and
+    optimizing it with IncrementalOptimizer
+    """
+
+    sentence = make_sentence(generator)
+    incremental = parser.IncrementalParser()
+    incremental_optimizer = optimizer.IncrementalOptimizer()
+
+    for _ in range(8):
+        expected = outcome(lambda sentence=sentence: full_parse(sentence))
+        ast = outcome(lambda sentence=sentence: incremental.parse(sentence))
+        got = shape(ast) if isinstance(ast, parser.GenericNode) else ast
+
+        if got != expected:
+            raise AssertionError(f'Case {case}: incremental parse differs in {sentence!r}')
+
+        # The shared nodes have the positions of the first one optimized, it depends
+        # on the groups that were reused
+        if isinstance(ast, parser.GenericNode):
+            expected = shape(optimizer.optimize(ast), positions=False)
+            got = shape(incremental_optimizer.optimize(ast, incremental.groups), positions=False)
+
+            if got != expected:
+                raise AssertionError(f'Case {case}: incremental optimization differs in ' \
+                                     f'{sentence!r}')
+
+        # Some edits are registered between two parses
+        for _ in range(generator.choice((1, 1, 2, 3))):
+            start = generator.randrange(len(sentence) + 1)
+            end = min(len(sentence), start + generator.choice((0, 0, 1, 1, 3)))
+            content = generator.choice(('', '', ' ')) if end > start else \
+                ''.join(generator.choices(PIECES, k=generator.randrange(1, 3)))
+
+            sentence = sentence[:start] + content + sentence[end:]
+            incremental.edit(start, end, len(content))
+
+def evaluations(interpreter: parser.Interpreter, ast: parser.GenericNode) -> List[Any]:
+    """Get the value of ast in each x of X_VALUES, and in all of them as an array"""
+
+    value = parser.NumericValue(ast)
+    value.compile(interpreter.flat)
+    results = [outcome(lambda x=x: repr(interpreter.evaluate(value, x=x))) for x in X_VALUES]
+
+    with numpy.errstate(all='ignore'):
+        x_values = numpy.array(X_VALUES)
+        results.append(outcome(lambda: repr(numpy.asarray( \
+            interpreter.evaluate(value, x=x_values)).tolist())))
+
+    return results
+
+def fuzz_optimizer(generator: random.Random, case: int) -> None:
+    """Evaluate an expression as parsed and optimized, with closures and flat"""
+
+    sentence = f'y: {expression(generator, generator.randrange(1, 7))}'
+    ast = parser.PrattParser(parser.Lexer(sentence).make_tokens()).parse_sentence().value
+
+    for flat in (False, True):
+        interpreter = parser.Interpreter(flat)
+
+        for definition in DEFINITIONS:
+            interpreter.visit(parser.PrattParser(parser.Lexer(definition).make_tokens()) \
+                              .parse_sentence())
+
+        if evaluations(interpreter, optimizer.optimize(ast)) != evaluations(interpreter, ast):
+            raise AssertionError(f'Case {case}: optimized value differs in {sentence!r}, ' \
+                                 f'flat={flat}')
+
+TARGETS = {
+    'incremental': fuzz_incremental,
+    'optimizer': fuzz_optimizer,
+    'parser': fuzz_parser
+}
+
+def main():
+    """Run the fuzz of a target, checking it gives the same results as its reference"""
+
+    arguments = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arguments.add_argument('target', choices=TARGETS, help='pass checked against its reference')
+    arguments.add_argument('--cases', type=int, default=100_000, help='fuzzed sentences')
+    arguments.add_argument('--seed', type=int, default=0, help='seed of the fuzzed sentences')
+    options = arguments.parse_args()
+
+    generator = random.Random(options.seed)
+
+    for case in range(options.cases):
+        TARGETS[options.target](generator, case)
+
+    print(f'{options.cases:,} fuzzed sentences: {options.target} gives the same results')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Benchmark of keystrokes in a long sentence, run with: python benchmarks/incremental.py"""
+
+import os
+import random
+import sys
+import timeit
+from typing import Any, Callable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from eq import optimizer, parser, sentences
+
+def make_expression(depth: int, seed: int=0) -> str:
+    """Create a nested expression, like a generated one"""
+
+    generator = random.Random(seed)
+
+    def expression(depth: int) -> str:
+        if depth == 0:
+            return generator.choice(('x', '2', 'a1', '0.5'))
+        operator = generator.choice(('+', ' - ', '*', '/', '^'))
+        return '(' + expression(depth - 1) + operator + expression(depth - 1) + ')'
+
+    return 'y: ' + expression(depth)
+
+def make_chain(length: int, operator: str, seed: int=0) -> str:
+    """Create a flat chain of operations, without parentheses"""
+
+    generator = random.Random(seed)
+    operands = [generator.choice(('x', '2', 'a1', '0.5')) for _ in range(length)]
+
+    return 'y: ' + operator.join(operands)
+
+def full_parse(sentence: str):
+    """Lex and parse sentence from scratch, with the parser of IncrementalParser"""
+
+    return parser.PrattParser(parser.Lexer(sentence).make_tokens()).parse_sentence()
+
+def parse_and_optimize(sentence: str):
+    """Lex, parse and optimize sentence from scratch, like a new Sentence"""
+
+    return optimizer.optimize(full_parse(sentence))
+
+def replace_char(sentence: sentences.Sentence, index: int, char: str):
+    """Replace the char of index by char and parse the sentence, like a keystroke"""
+
+    sentence.pop(index)
+    sentence.append(char, index)
+    sentence.parse_ast()
+
+def report(name: str, sentence: str, full: Callable[[], Any], keystrokes: Callable[[], Any]):
+    """Time a full parse of sentence and the two keystrokes that edit it and restore it"""
+
+    number = max(1, 100_000 // len(sentence))
+
+    full_time = min(timeit.repeat(full, number=number, repeat=3)) / number
+    edit_time = min(timeit.repeat(keystrokes, number=number, repeat=3)) / number / 2
+
+    print(f'{name:>17}, {len(sentence):>7} chars: full {full_time * 1000:9.3f} ms, ' \
+          f'incremental {edit_time * 1000:7.3f} ms, speedup {full_time / edit_time:.1f}x')
+
+def main():
+    """Time typing a char in the middle of long sentences, parsing and then optimizing"""
+
+    # The flat chains are parsed again whole, only the parenthesized groups are reused
+    cases = [(f'nested, depth {depth}', make_expression(depth)) for depth in (6, 10, 13)]
+    cases += [(f'flat {name} chain', make_chain(length, operator)) \
+              for name, operator, length in (('+', ' + ', 2000), ('^', '^', 12_500))]
+
+    print('Parse, with IncrementalParser:')
+
+    for name, sentence in cases:
+        index = sentence.index('x', len(sentence) // 2)
+
+        incremental = parser.IncrementalParser()
+        incremental.parse(sentence)
+
+        def keystrokes(incremental=incremental, sentence=sentence, index=index):
+            # Replace the x by 3 and back, so each run starts with the same sentence
+            incremental.edit(index, index + 1, 1)
+            incremental.parse(sentence[:index] + '3' + sentence[index + 1:])
+            incremental.edit(index, index + 1, 1)
+            incremental.parse(sentence)
+
+        report(name, sentence, lambda sentence=sentence: full_parse(sentence), keystrokes)
+
+    print('Parse and optimize, with Sentence.parse_ast:')
+
+    for name, sentence in cases:
+        index = sentence.index('x', len(sentence) // 2)
+
+        edited = sentences.Sentence(sentence)
+        edited.parse_ast()
+
+        def keystrokes(edited=edited, index=index):
+            replace_char(edited, index, '3')
+            replace_char(edited, index, 'x')
+
+        report(name, sentence, lambda sentence=sentence: parse_and_optimize(sentence), \
+               keystrokes)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""
+Fuzz and benchmark of the Lexer against the char by char lexer it replaced, run with:
+    python benchmarks/lexer.py [--cases 100000] [--seed 0]
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+from typing import Generator, List, Tuple, Union
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from eq import parser # pylint: disable=wrong-import-position
+
+DIGITS = '0123456789'
+ALPHABET = 'abcdefghijklmnopqrstuvwxyz'
+
+# Chars of the fuzzed sentences: all the kinds of tokens, KELVIN SIGN and illegal chars
+FUZZ_CHARS = DIGITS + '..' + 'abxyzAXZK' + ''.join(parser.Lexer.TOKENS_TYPES) + '   \t!é\n'
+
+class CharLexer:
+    """The lexer advancing and concatenating char by char, the reference of Lexer"""
+
+    def __init__(self, sentence) -> None:
+        self.sentence = sentence
+        self.index = -1
+        self.current_char = None
+        self.advance()
+
+    def advance(self):
+        """Advance the index and update the current_char"""
+
+        self.index += 1
+        if self.index < len(self.sentence):
+            self.current_char = self.sentence[self.index]
+        else:
+            self.current_char = None
+
+    def make_tokens(self) -> Generator[parser.Token, None, None]:
+        """Get all tokens of sentence"""
+
+        while self.current_char is not None:
+            if self.current_char in DIGITS:
+                yield self.make_numbers()
+
+            elif self.current_char.lower() in ALPHABET:
+                yield self.make_var()
+
+            elif self.current_char in parser.Lexer.TOKENS_TYPES:
+                yield self.make_operator()
+
+            elif self.current_char == ' ':
+                self.advance()
+
+            else:
+                raise parser.IllegalCharError(self.current_char, index=self.index)
+
+        yield parser.Token(parser.TT_EOF, self.index)
+
+    def make_operator(self):
+        """Create operator token, of one char or two chars (like <=)"""
+
+        tokens_types = parser.Lexer.TOKENS_TYPES
+        operator = self.current_char
+        position = self.index
+        self.advance()
+
+        if self.current_char is not None and operator + self.current_char in tokens_types:
+            operator += self.current_char
+            self.advance()
+
+        return parser.Token(tokens_types[operator], position, length=len(operator))
+
+    def make_numbers(self):
+        """Create number token (INT and FLOAT)"""
+
+        num_str = ''
+        has_dot = False
+        position = self.index
+
+        while self.current_char is not None and self.current_char in DIGITS + '.':
+            if self.current_char == '.':
+                if has_dot:
+                    break
+                has_dot = True
+            num_str += self.current_char
+            self.advance()
+
+        if not has_dot:
+            return parser.Token(parser.TT_INT, position, int(num_str), length=len(num_str))
+
+        return parser.Token(parser.TT_FLOAT, position, float(num_str), length=len(num_str))
+
+    def make_var(self):
+        """Create number token (VAR)"""
+
+        var_name = ''
+        position = self.index
+
+        while self.current_char is not None and self.current_char.lower() in ALPHABET + DIGITS:
+            var_name += self.current_char
+            self.advance()
+
+        return parser.Token(parser.TT_VAR, position, var_name, length=len(var_name))
+
+def make_sentence(length: int, seed: int=0) -> str:
+    """Create a valid sentence of about length chars"""
+
+    generator = random.Random(seed)
+    parts = ['a0:']
+    size = len(parts[0])
+
+    while size < length:
+        parts.append(generator.choice(('12', '3.25', 'x', 'value', '(b1', '2)')))
+        parts.append(generator.choice((' + ', '-', '*', ' / ', '^', ' <= ')))
+        size += len(parts[-2]) + len(parts[-1])
+
+    parts.append('1')
+    return ''.join(parts)
+
+def tokens_of(lexer: Union[parser.Lexer, CharLexer]) -> Union[List[Tuple], Tuple]:
+    """Get the tokens as comparable tuples, or the position and char of the error"""
+
+    try:
+        return [(token.type, token.value, token.position, token.length) \
+                for token in lexer.make_tokens()]
+    except parser.IllegalCharError as error:
+        return (error.index, error.char)
+
+def fuzz(cases: int, seed: int) -> None:
+    """Check that both lexers give the same tokens and errors for cases random sentences"""
+
+    generator = random.Random(seed)
+
+    for case in range(cases):
+        sentence = ''.join(generator.choices(FUZZ_CHARS, k=generator.randrange(1, 40)))
+
+        if tokens_of(parser.Lexer(sentence)) != tokens_of(CharLexer(sentence)):
+            raise AssertionError(f'Case {case}: Lexer differs from CharLexer in {sentence!r}')
+
+    print(f'{cases:,} fuzzed sentences: same tokens and errors\n')
+
+def main():
+    """Run the fuzz, then the benchmark, and print the time of each lexer"""
+
+    arguments = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arguments.add_argument('--cases', type=int, default=100_000, help='fuzzed sentences')
+    arguments.add_argument('--seed', type=int, default=0, help='seed of the fuzzed sentences')
+    options = arguments.parse_args()
+
+    fuzz(options.cases, options.seed)
+
+    for length in (100, 10_000, 100_000):
+        sentence = make_sentence(length)
+        tokens = tokens_of(parser.Lexer(sentence))
+
+        if tokens != tokens_of(CharLexer(sentence)):
+            raise AssertionError('Lexer tokens differ from CharLexer tokens')
+
+        number = max(1, 1_000_000 // length)
+        results = {}
+
+        for lexer in (CharLexer, parser.Lexer):
+            seconds = min(timeit.repeat(lambda lexer=lexer, sentence=sentence: \
+                                        list(lexer(sentence).make_tokens()), \
+                                        number=number, repeat=3)) / number
+            results[lexer.__name__] = seconds
+            print(f'{lexer.__name__:>9} {length:>9} chars: {seconds * 1000:10.3f} ms, ' \
+                  f'{len(tokens) / seconds:14,.0f} tokens/s')
+
+        print(f'{"speedup":>9} {results["CharLexer"] / results["Lexer"]:.1f}x\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""
+Benchmark suite of the hot paths: lexer, parser, interpreter and rendering.
+It runs headless with synthetic workloads and prints the results as JSON, run with:
+    python benchmarks/suite.py [--output results.json] [--repeat 5] [--quick]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, Iterable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The JSON is printed in stdout, without the banner of pygame
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+# pylint: disable=wrong-import-position
+import numpy
+import pygame
+from eq import headless, parser, sentences
+
+VIEWPORT = (-10, 10, -10, 10)
+
+def long_expression(size: int, seed: int=0) -> List[str]:
+    """One curve with a generated nested expression of about size chars"""
+
+    generator = random.Random(seed)
+
+    def expression(depth: int) -> str:
+        if depth == 0:
+            return generator.choice(('x', '2', '0.5', 'x/3'))
+        operator = generator.choice(('+', ' - ', '*'))
+        return '(' + expression(depth - 1) + operator + expression(depth - 1) + ')'
+
+    depth = max(1, (size // 8).bit_length())
+    return ['y: ' + expression(depth)]
+
+def variable_chain(length: int) -> List[str]:
+    """Variables defined by the previous one, and a curve that uses the last one"""
+
+    lines = ['v0: 1']
+    lines.extend(f'v{index}: v{index - 1} * 1.01 + 0.5' for index in range(1, length))
+    lines.append(f'y: x * v{length - 1} / {length}')
+    return lines
+
+def dots(count: int, seed: int=0) -> List[str]:
+    """Anonymous dots spread over the viewport"""
+
+    generator = random.Random(seed)
+    return [f'({generator.uniform(-10, 10):.3f}, {generator.uniform(-10, 10):.3f})' \
+            for _ in range(count)]
+
+def document(count: int, seed: int=0) -> List[str]:
+    """A document mixing definitions, curves, implicit curves, regions and dots"""
+
+    generator = random.Random(seed)
+    lines = []
+
+    for index in range(count):
+        kind = index % 5
+        number = generator.randint(1, 9)
+
+        if kind == 0:
+            lines.append(f'a{index}: {number} / 10')
+        elif kind == 1:
+            lines.append(f'y: a{index - 1} * x^2 - {number}')
+        elif kind == 2:
+            lines.append(f'x^2 + y^2 = {number}')
+        elif kind == 3:
+            lines.append(f'y < x - {number}')
+        else:
+            lines.append(f'({number}, a{index - 4})')
+
+    return lines
+
+WORKLOADS: Dict[str, Callable[[bool], List[str]]] = {
+    'long_expression': lambda quick: long_expression(2_000 if quick else 20_000),
+    'variable_chain': lambda quick: variable_chain(1_000 if quick else 10_000),
+    'dots_10k': lambda quick: dots(1_000 if quick else 10_000),
+    'dots_100k': lambda quick: dots(10_000 if quick else 100_000),
+    'document': lambda quick: document(100 if quick else 1_000)
+}
+
+def measure(function: Callable[[Any], object], items: Iterable) -> List[float]:
+    """Call function with each item, returning the duration of each call in seconds"""
+
+    samples = []
+
+    for item in items:
+        start = time.perf_counter()
+        function(item)
+        samples.append(time.perf_counter() - start)
+
+    return samples
+
+def summary(workload: str, stage: str, samples: List[float], items: int, unit: str) -> dict:
+    """Latency percentiles of the samples, and throughput of items by second"""
+
+    durations = numpy.array(samples)
+
+    return {
+        'workload': workload,
+        'stage': stage,
+        'samples': len(samples),
+        'p50_ms': float(numpy.percentile(durations, 50)) * 1000,
+        'p99_ms': float(numpy.percentile(durations, 99)) * 1000,
+        'mean_ms': float(durations.mean()) * 1000,
+        'throughput': items / float(durations.sum()),
+        'unit': unit
+    }
+
+def run_workload(name: str, lines: List[str], renderer: headless.Renderer, repeat: int \
+                 ) -> List[dict]:
+    """Measure each stage of the workload, the stages of a single line are sampled by line"""
+
+    results = []
+
+    tokens = [list(parser.Lexer(line).make_tokens()) for line in lines]
+    tokens_count = sum(len(line_tokens) for line_tokens in tokens)
+
+    samples = measure(lambda line: list(parser.Lexer(line).make_tokens()), lines * repeat)
+    results.append(summary(name, 'lex', samples, tokens_count * repeat, 'tokens/s'))
+
+    samples = measure(lambda line_tokens: parser.PrattParser(line_tokens).parse_sentence(), \
+                      tokens * repeat)
+    results.append(summary(name, 'parse', samples, tokens_count * repeat, 'tokens/s'))
+
+    samples = measure(lambda line: sentences.Sentence(line).parse_ast(), lines * repeat)
+    results.append(summary(name, 'parse_ast', samples, len(lines) * repeat, 'sentences/s'))
+
+    universe = sentences.Universe()
+    samples = []
+
+    for _ in range(repeat):
+        parsed = [sentences.Sentence(line) for line in lines]
+        for sentence in parsed:
+            sentence.parse_ast()
+
+        universe = sentences.Universe()
+        samples.extend(measure(universe.replace, [parsed]))
+    results.append(summary(name, 'interpret', samples, len(lines) * repeat, 'sentences/s'))
+
+    check(name, universe)
+
+    samples = measure(lambda _: renderer.render(universe, VIEWPORT), range(repeat))
+    results.append(summary(name, 'draw', samples, repeat, 'frames/s'))
+
+    return results
+
+def check(workload: str, universe: sentences.Universe) -> None:
+    """
+    Raise if a sentence of the workload has an error or a value can't be evaluated.
+    Drawing skips them, so a broken workload would be measured as a fast one
+    """
+
+    for sentence in universe.sentences:
+        if sentence.error_data is not False:
+            raise RuntimeError(f'{workload}: error in {sentence.sentence!r}: {sentence.error_data}')
+
+    interpreter = universe.interpreter
+    x_values = numpy.linspace(VIEWPORT[0], VIEWPORT[1], 5)
+
+    for name, variable in interpreter.vars.items():
+        for value in variable if name == interpreter.NO_NAME_VARNAME else (variable,):
+            if isinstance(value, parser.DotValue):
+                value.get_value(interpreter)
+            elif isinstance(value, parser.CurveValue):
+                value.get_values(interpreter, x_values)
+            elif isinstance(value, parser.ImplicitValue):
+                value.get_values(interpreter, x_values, x_values)
+            elif isinstance(value, parser.NumericValue):
+                interpreter.evaluate(value, x=x_values)
+
+def metadata(args) -> dict:
+    """Describe the environment, so the results can be compared over time"""
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, \
+                                check=True, cwd=os.path.dirname(os.path.abspath(__file__)) \
+                                ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': numpy.__version__,
+        'pygame': pygame.version.ver,
+        'repeat': args.repeat,
+        'quick': args.quick,
+        'size': args.size
+    }
+
+def main(args=None):
+    """Run all workloads and print or save the results as JSON"""
+
+    arg_parser = argparse.ArgumentParser(prog='python benchmarks/suite.py', description=__doc__, \
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--output', help='save the JSON in this file, instead of printing')
+    arg_parser.add_argument('--repeat', type=int, default=5, help='runs of each stage')
+    arg_parser.add_argument('--quick', action='store_true', help='smaller workloads')
+    arg_parser.add_argument('--size', default='800x600', help='canvas size, like 800x600')
+    arg_parser.add_argument('--workload', action='append', choices=sorted(WORKLOADS), \
+                            help='run only this workload, can be repeated')
+    args = arg_parser.parse_args(args)
+
+    width, height = (int(value) for value in args.size.lower().split('x'))
+    renderer = headless.Renderer(width, height)
+
+    results = []
+    for name in args.workload or WORKLOADS:
+        print(f'running {name}', file=sys.stderr)
+
+        # The errors printed while drawing don't go in the JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            results.extend(run_workload(name, WORKLOADS[name](args.quick), renderer, args.repeat))
+
+    report = json.dumps({'metadata': metadata(args), 'results': results}, indent=2)
+
+    if args.output is None:
+        print(report)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            output.write(report + '\n')
+
+if __name__ == '__main__':
+    main()
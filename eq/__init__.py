@@ -1,78 +1,580 @@
 """This script creates a screen to graph some simple math sentences"""
 
-from typing import Tuple
+import itertools
+import math
+from typing import Callable, List, Set, Tuple, Union
+import numpy
 import pygame
 from . import sentences
 from . import parser
+from . import text_cache
+from . import tile_cache
+from . import profiling
+from . import spatial
+from . import evaluation
 
 class DrawGraph:
     """Class to draw the universe"""
 
     GRID_SIZE = 1
+    MIN_GRID_SPACING = 20
+    REGION_COLOR = (0, 0, 255)
+    REGION_ALPHA = 60
+    POINT_COLOR = 'red'
+    POINT_RADIUS = 4
+    SPRITE_COLORKEY = (0, 255, 0)
+
+    # Pixels of the lines past their points, the lines this close to canvas are drawn
+    LINE_MARGIN = 2
+
+    # Points by pixel of canvas over which the points are drawn as a heatmap
+    DENSITY_THRESHOLD = 0.1
+    DENSITY_MIN_ALPHA = 60
 
     def __init__(self, canvas: pygame.Surface, universe: sentences.Universe, \
-                 origin: pygame.Vector2, scale: float) -> None:
+                 origin: pygame.Vector2, scale: float, \
+                 profiler: Union[profiling.Profiler, None]=None, \
+                 tiles: Union[tile_cache.TileCache, None]=None) -> None:
         self.canvas = canvas
         self.universe = universe
         self.origin = origin
         self.scale = scale
+        self.profiler = profiler or profiling.Profiler()
+
+        # In the scales of its zoom levels, the values are drawn in cached tiles
+        self.tiles = tiles
+        self._tile_renderer: Union['DrawGraph', None] = None
+
+        # The dots of the tiles are drawn as a heatmap, decided once by frame for all of them
+        self._dense_tiles = False
+
+        self._grid_tile: Union[pygame.Surface, None] = None
+        self._grid_key: Union[Tuple[int, int, int], None] = None
+
+        # The last snapshot drawn, its dots are evaluated again only when the universe changes
+        self._snapshot: Union[evaluation.Snapshot, None] = None
+        self._point_sprite: Union[pygame.Surface, None] = None
+
+    def grid_spacing(self) -> int:
+        """
+        Pixels between the grid lines. The step of grid grows in 1, 2, 5 multiples of
+        GRID_SIZE, so the lines are at least MIN_GRID_SPACING pixels apart in any scale
+        """
+
+        step = self.GRID_SIZE
+        multiples = itertools.cycle((2, 2.5, 2))
+
+        while step * self.scale < self.MIN_GRID_SPACING:
+            step *= next(multiples)
+
+        return int(step * self.scale)
 
     def draw_grid(self, canvas_position: Tuple[int, int, int, int]):
         """Draw the grid"""
         canvas_x, canvas_y, width, height = canvas_position
 
-        pygame.draw.rect(self.canvas, 'white', canvas_position)
-
-        grid_size = int(self.GRID_SIZE * self.scale)
+        grid_size = self.grid_spacing()
         origin_x, origin_y = int(self.origin.x), int(self.origin.y)
 
-        for grid_x in range(origin_x % grid_size, canvas_x+width, grid_size):
-            if grid_x == origin_x:
-                pygame.draw.line(self.canvas, 'black', (grid_x, canvas_y), \
-                                 (grid_x, canvas_y+height), 2)
-            else:
-                pygame.draw.line(self.canvas, 'gray', (grid_x, canvas_y), (grid_x, canvas_y+height))
+        # The lines are cached in a tile, panning only moves the blitted area
+        if self._grid_key != (grid_size, width, height):
+            self._grid_key = (grid_size, width, height)
+            self._grid_tile = self._make_grid_tile(grid_size, width, height)
 
-        for grid_y in range(origin_y % grid_size, canvas_y + height, grid_size):
-            if grid_y == origin_y:
-                pygame.draw.line(self.canvas, 'black', (canvas_x, grid_y), \
-                                 (canvas_x + width, grid_y), 2)
-            else:
-                pygame.draw.line(self.canvas, 'gray', (canvas_x, grid_y), (canvas_x+width, grid_y))
+        self.canvas.blit(self._grid_tile, (canvas_x, canvas_y), ( \
+            (canvas_x - origin_x) % grid_size, (canvas_y - origin_y) % grid_size, width, height
+        ))
+
+        # An axis on the border is drawn, half of it is in the neighbour tile
+        if canvas_x - 1 <= origin_x <= canvas_x + width:
+            pygame.draw.line(self.canvas, 'black', (origin_x, canvas_y), \
+                             (origin_x, canvas_y+height), 2)
+
+        if canvas_y - 1 <= origin_y <= canvas_y + height:
+            pygame.draw.line(self.canvas, 'black', (canvas_x, origin_y), \
+                             (canvas_x + width, origin_y), 2)
+
+    @staticmethod
+    def _make_grid_tile(grid_size: int, width: int, height: int) -> pygame.Surface:
+        """Create the grid with a line in each grid_size pixels, one grid_size larger than canvas"""
 
+        tile = pygame.Surface((width + grid_size, height + grid_size))
+        tile.fill('white')
+
+        for grid_x in range(0, width + grid_size, grid_size):
+            pygame.draw.line(tile, 'gray', (grid_x, 0), (grid_x, height + grid_size))
+
+        for grid_y in range(0, height + grid_size, grid_size):
+            pygame.draw.line(tile, 'gray', (0, grid_y), (width + grid_size, grid_y))
+
+        return tile
 
     def add_position(self, delta: pygame.Vector2):
         """Add value of graph position"""
         self.origin += delta
 
     def draw(self, canvas_position: Tuple[int, int, int, int]):
-        """Draw the elements in canvas"""
+        """Evaluate the universe and draw it in canvas, reporting the values over budget"""
+
+        evaluator = evaluation.Evaluator(self.universe.interpreter, tuple(self.origin), \
+                                         self.scale, canvas_position, self.profiler)
+
+        with self.profiler.timer('evaluate'):
+            self._snapshot = evaluator.snapshot((self.universe, self.universe.version), \
+                                                self._snapshot)
 
-        self.draw_grid(canvas_position)
+        self.universe.report_errors(self._snapshot.errors)
+        self.draw_snapshot(self._snapshot, canvas_position)
 
-        for name, value in self.universe.interpreter.vars.items():
-            if name == self.universe.interpreter.NO_NAME_VARNAME:
-                for value_without_name in value:
-                    if isinstance(value_without_name, parser.DotValue):
-                        self._draw_point(value_without_name, canvas_position)
+    def draw_snapshot(self, snapshot: Union[evaluation.Snapshot, None], \
+                      canvas_position: Tuple[int, int, int, int]):
+        """
+        Draw the grid and the geometry of snapshot in canvas. The snapshot can be
+        evaluated in another view, it's moved and scaled to the current one
+        """
+
+        with self.profiler.timer('draw grid'):
+            self.draw_grid(canvas_position)
+
+        level = None if self.tiles is None else self.tiles.level(self.scale)
+
+        if level is not None:
+            with self.profiler.timer('draw tiles'):
+                if snapshot is not None:
+                    self._dense_tiles = self._is_dense(snapshot.points, canvas_position)
+                self._draw_tiles(snapshot, level, canvas_position)
+            return
+
+        if snapshot is None:
+            return
+
+        with self.profiler.timer('draw values'):
+            self._draw_values(snapshot, canvas_position)
+
+    def _draw_values(self, snapshot: evaluation.Snapshot, \
+                     canvas_position: Tuple[int, int, int, int], points_margin: int=0, \
+                     dense: Union[bool, None]=None):
+        """
+        Draw the values of snapshot, and the dots up to points_margin outside canvas.
+        The dots are drawn as a heatmap if dense, by default if they are dense in canvas
+        """
+
+        for layer in snapshot.layers:
+            if isinstance(layer, evaluation.Curve):
+                self._draw_curve(layer, canvas_position)
             else:
-                if isinstance(value, parser.DotValue):
-                    self._draw_point(value, canvas_position)
+                self._draw_implicit(layer, canvas_position)
 
-    def _draw_point(self, variable: parser.DotValue, canvas_position: Tuple[int, int, int, int]):
-        try:
-            dot = variable.get_value(self.universe.interpreter)
-        except (parser.UndefinedVariableError, parser.UnexpectedVariableTypeError) as error:
-            print(error)
+        canvas_x, canvas_y, width, height = canvas_position
+        self._draw_points(snapshot.points, (canvas_x - points_margin, canvas_y - points_margin, \
+                                            width + 2 * points_margin, height + 2 * points_margin), \
+                          dense)
+
+    def missing_area(self, canvas_position: Tuple[int, int, int, int] \
+                     ) -> Union[Tuple[int, int, int, int], None]:
+        """
+        Get the rectangle (x, y, width, height) of the tiles over canvas that aren't cached
+        for the universe version, in the pixels of the zoom level. None if all are cached
+        """
+
+        level, size = self.tiles.level(self.scale), self.tiles.SIZE
+        columns, rows = self._tile_ranges(canvas_position)
+
+        missing = [(column, row) for row in rows for column in columns \
+                   if (level, column, row, self.universe.version, self._dense_tiles) \
+                   not in self.tiles]
+
+        if not missing:
+            return None
+
+        missing_columns, missing_rows = zip(*missing)
+        first_column, first_row = min(missing_columns), min(missing_rows)
+
+        return (first_column * size, first_row * size, \
+                (max(missing_columns) + 1 - first_column) * size, \
+                (max(missing_rows) + 1 - first_row) * size)
+
+    def _tile_ranges(self, canvas_position: Tuple[int, int, int, int]) -> Tuple[range, range]:
+        """Get the columns and the rows of the tiles over canvas"""
+
+        canvas_x, canvas_y, width, height = canvas_position
+        size = self.tiles.SIZE
+
+        # The tiles are aligned with the grid, that is drawn from the integer origin
+        left, top = canvas_x - int(self.origin.x), canvas_y - int(self.origin.y)
+
+        return range(left // size, (left + width - 1) // size + 1), \
+            range(top // size, (top + height - 1) // size + 1)
+
+    def _draw_tiles(self, snapshot: Union[evaluation.Snapshot, None], level: int, \
+                    canvas_position: Tuple[int, int, int, int]):
+        """
+        Blit the tiles over canvas. A tile that isn't cached is drawn from snapshot if
+        it covers the tile, else the tiles of the nearest zoom levels are scaled to it
+        """
+
+        size = self.tiles.SIZE
+        origin_x, origin_y = int(self.origin.x), int(self.origin.y)
+        columns, rows = self._tile_ranges(canvas_position)
+
+        blits: List[Tuple[pygame.Surface, Tuple[int, int]]] = []
+
+        for row in rows:
+            for column in columns:
+                tile = self._cached_tile(level, column, row, snapshot)
+
+                if tile is None and snapshot is not None and \
+                    self._covers(snapshot, level, column, row):
+                    tile = self._render_tile(snapshot, level, column, row)
+
+                if tile is None:
+                    self._draw_scaled_tile(snapshot, level, column, row)
+                else:
+                    blits.append((tile, (origin_x + column * size, origin_y + row * size)))
+
+        self.canvas.blits(blits, doreturn=False)
+        self.profiler.count('tiles drawn', len(blits))
+
+    def _cached_tile(self, level: int, column: int, row: int, \
+                     snapshot: Union[evaluation.Snapshot, None]) -> Union[pygame.Surface, None]:
+        """Get the tile of the universe version, or else of the version of snapshot"""
+
+        tile = self.tiles.get((level, column, row, self.universe.version, self._dense_tiles))
+
+        if tile is None and snapshot is not None:
+            tile = self.tiles.get((level, column, row, snapshot.key[1], self._dense_tiles))
+        return tile
+
+    def _covers(self, snapshot: evaluation.Snapshot, level: int, column: int, row: int) -> bool:
+        """Check if snapshot was evaluated in the zoom level, over all the tile"""
+
+        scale, size = self.tiles.level_scale(level), self.tiles.SIZE
+
+        if not math.isclose(snapshot.scale, scale):
+            return False
+
+        # Pixels of the zoom level, the y goes down. Errors under half pixel are ignored
+        x_min, x_max, y_min, y_max = (value * scale for value in snapshot.area)
+
+        return x_min <= column * size + 0.5 and (column + 1) * size - 0.5 <= x_max and \
+            -y_max <= row * size + 0.5 and (row + 1) * size - 0.5 <= -y_min
+
+    def _render_tile(self, snapshot: evaluation.Snapshot, level: int, column: int, row: int \
+                     ) -> pygame.Surface:
+        """Draw the grid and the values of snapshot in the tile, and cache it"""
+
+        size = self.tiles.SIZE
+        tile = pygame.Surface((size, size), 0, self.canvas)
+
+        # The same drawing of the canvas, with the tile as canvas
+        if self._tile_renderer is None:
+            self._tile_renderer = DrawGraph(tile, self.universe, pygame.Vector2(), 1, \
+                                            self.profiler)
+
+        renderer = self._tile_renderer
+        renderer.canvas = tile
+        renderer.origin = pygame.Vector2(-column * size, -row * size)
+        renderer.scale = self.tiles.level_scale(level)
+
+        renderer.draw_grid((0, 0, size, size))
+        # The dots cut by the border are drawn in both tiles, all the tiles as dots or heatmap
+        renderer._draw_values(snapshot, (0, 0, size, size), # pylint: disable=protected-access
+                              self.POINT_RADIUS + 1, self._dense_tiles)
+
+        self.tiles.put((level, column, row, snapshot.key[1], self._dense_tiles), tile)
+        self.profiler.count('tiles rendered')
+        return tile
+
+    def _draw_scaled_tile(self, snapshot: Union[evaluation.Snapshot, None], level: int, \
+                          column: int, row: int):
+        """
+        Draw the area of a tile that isn't cached with the cached tiles of the nearest
+        zoom levels, scaled. Nothing is drawn if none of them has all the tiles
+        """
+
+        size = self.tiles.SIZE
+        origin_x, origin_y = int(self.origin.x), int(self.origin.y)
+
+        for neighbour in (level - 1, level + 1, level - 2, level + 2):
+            ratio = self.tiles.level_scale(neighbour) / self.tiles.level_scale(level)
+
+            tiles = [(neighbour_column, neighbour_row, self._cached_tile( \
+                          neighbour, neighbour_column, neighbour_row, snapshot)) \
+                     for neighbour_row in range(math.floor(row * ratio), \
+                                                math.ceil((row + 1) * ratio)) \
+                     for neighbour_column in range(math.floor(column * ratio), \
+                                                   math.ceil((column + 1) * ratio))]
+
+            if any(tile is None for _, _, tile in tiles):
+                continue
+
+            clip = self.canvas.get_clip()
+            self.canvas.set_clip(clip.clip(origin_x + column * size, origin_y + row * size, \
+                                           size, size))
+
+            for neighbour_column, neighbour_row, tile in tiles:
+                left = origin_x + round(neighbour_column * size / ratio)
+                top = origin_y + round(neighbour_row * size / ratio)
+                right = origin_x + round((neighbour_column + 1) * size / ratio)
+                bottom = origin_y + round((neighbour_row + 1) * size / ratio)
+
+                self.canvas.blit(pygame.transform.scale(tile, (right - left, bottom - top)), \
+                                 (left, top))
+
+            self.canvas.set_clip(clip)
+            self.profiler.count('tiles scaled', len(tiles))
             return
 
+    def to_screen(self, world_x: numpy.ndarray, world_y: numpy.ndarray \
+                  ) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """Convert graph coordinates to the screen"""
+
+        return world_x * self.scale + self.origin.x, self.origin.y - world_y * self.scale
+
+    def to_pixels(self, world_x: numpy.ndarray, world_y: numpy.ndarray) -> numpy.ndarray:
+        """
+        Convert graph coordinates to screen points, for the lines. They are rounded, so
+        the errors of converting screen points to the graph and back aren't truncated
+        """
+
+        return numpy.round(numpy.stack(self.to_screen(world_x, world_y), axis=-1), 6)
+
+    def _draw_implicit(self, implicit: evaluation.Implicit, \
+                       canvas_position: Tuple[int, int, int, int]):
+        if implicit.region is not None:
+            self._draw_region(implicit.region, implicit.area, canvas_position)
+
+        segments = self.to_pixels(implicit.segments[:, :, 0], implicit.segments[:, :, 1])
+
+        # Only the segments over canvas are drawn, like in a tile
         canvas_x, canvas_y, width, height = canvas_position
+        low, high = segments.min(axis=1), segments.max(axis=1)
+        margin = self.LINE_MARGIN
+
+        over = (high[:, 0] >= canvas_x - margin) & (low[:, 0] <= canvas_x + width + margin) & \
+            (high[:, 1] >= canvas_y - margin) & (low[:, 1] <= canvas_y + height + margin)
+
+        for start, end in segments[over].tolist():
+            pygame.draw.line(self.canvas, 'blue', start, end, 2)
+
+    def _draw_region(self, mask: numpy.ndarray, area: evaluation.Rectangle, \
+                     canvas_position: Tuple[int, int, int, int]):
+        """
+        Shade the mask of grid over area, blitting it as a single surface. Only the cells
+        over canvas are scaled and blitted
+        """
+
+        rows, columns = mask.shape
+        x_min, x_max, y_min, y_max = area
+        cell_width, cell_height = (x_max - x_min) / columns, (y_max - y_min) / rows
+
+        # The grid goes down from y_max, like the rows
+        left, right, bottom, top = self._graph_rectangle(canvas_position)
+        first_column = max(0, math.floor((left - x_min) / cell_width))
+        last_column = min(columns, math.ceil((right - x_min) / cell_width))
+        first_row = max(0, math.floor((y_max - top) / cell_height))
+        last_row = min(rows, math.ceil((y_max - bottom) / cell_height))
+
+        if first_column >= last_column or first_row >= last_row:
+            return
 
-        dot = pygame.Vector2(dot[0],-dot[1])
-        dot = dot * self.scale + self.origin
+        # surfarray is indexed by [x, y], the grid by [row, column]
+        mask = mask[first_row:last_row, first_column:last_column].T
+        area = (x_min + first_column * cell_width, x_min + last_column * cell_width, \
+                y_max - last_row * cell_height, y_max - first_row * cell_height)
 
-        if 0 < dot.x -canvas_x < width and 0 < dot.y -canvas_y < height:
-            pygame.draw.circle(self.canvas, 'red', dot, 4)
+        surface = pygame.Surface(mask.shape, pygame.constants.SRCALPHA)
+        surface.fill((*self.REGION_COLOR, 0))
+
+        alpha = pygame.surfarray.pixels_alpha(surface)
+        alpha[mask] = self.REGION_ALPHA
+        del alpha
+
+        self._blit_area(surface, area)
+
+    def _blit_area(self, surface: pygame.Surface, area: evaluation.Rectangle):
+        """Scale surface to area, in the graph coordinates, and blit it"""
+
+        x_min, x_max, y_min, y_max = area
+
+        left, top = (round(value) for value in self.to_screen(x_min, y_max))
+        right, bottom = (round(value) for value in self.to_screen(x_max, y_min))
+
+        self.canvas.blit(pygame.transform.scale(surface, (right - left, bottom - top)), \
+                         (left, top))
+
+    def _draw_curve(self, curve: evaluation.Curve, canvas_position: Tuple[int, int, int, int]):
+        canvas_x, canvas_y, width, height = canvas_position
+        screen_x, screen_y = self.to_pixels(curve.x_values, curve.y_values).T
+
+        # The samples are sorted by x, the ones over canvas are drawn with one more by side
+        first = max(0, numpy.searchsorted(screen_x, canvas_x - self.LINE_MARGIN) - 1)
+        last = numpy.searchsorted(screen_x, canvas_x + width + self.LINE_MARGIN, 'right') + 1
+        screen_x, screen_y = screen_x[first:last], screen_y[first:last]
+
+        # The lines are cut far outside the canvas, pygame can't draw huge coordinates
+        screen_x, screen_y = self._clip_to_band(screen_x, screen_y, canvas_y - height, \
+                                                canvas_y + 2 * height)
+        self._draw_polylines(screen_x, screen_y, 'blue')
+
+    @staticmethod
+    def _clip_to_band(screen_x: numpy.ndarray, screen_y: numpy.ndarray, low: float, \
+                      high: float) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        Cut the segments between consecutive points to low <= y <= high, interpolating where
+        they cross the band. The lines are broken by NaN where y isn't finite, and where
+        they leave the band
+        """
+
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            screen_y = numpy.where(numpy.isfinite(screen_y), screen_y, numpy.nan)
+
+            x_start, x_end = screen_x[:-1], screen_x[1:]
+            y_start, y_end = screen_y[:-1], screen_y[1:]
+            delta_x, delta_y = x_end - x_start, y_end - y_start
+
+            # The segments go from t = 0 to t = 1, these are the t where they are in the band
+            t_low, t_high = (low - y_start) / delta_y, (high - y_start) / delta_y
+            t_start = numpy.maximum(0, numpy.where(delta_y > 0, t_low, t_high))
+            t_end = numpy.minimum(1, numpy.where(delta_y > 0, t_high, t_low))
+
+            flat = delta_y == 0
+            inside = (low <= y_start) & (y_start <= high)
+            t_start = numpy.where(flat, numpy.where(inside, 0, numpy.nan), t_start)
+            t_end = numpy.where(flat, 1, t_end)
+
+            # The comparisons with NaN are false
+            kept = t_start < t_end
+
+        # A line goes on from the last segment if none of both was cut between them
+        follows = numpy.zeros(len(kept), dtype=bool)
+        follows[1:] = kept[:-1] & (t_end[:-1] == 1) & (t_start[1:] == 0)
+        starts = (kept & ~follows)[kept]
+
+        # The ends that weren't cut are the same points, without errors of interpolation
+        cut_x = numpy.where(t_start == 0, x_start, x_start + t_start * delta_x)[kept]
+        cut_y = numpy.where(t_start == 0, y_start, y_start + t_start * delta_y)[kept]
+        end_x = numpy.where(t_end == 1, x_end, x_start + t_end * delta_x)[kept]
+        end_y = numpy.where(t_end == 1, y_end, y_start + t_end * delta_y)[kept]
+
+        # Each segment adds its end, the first of a line adds a break and its start before
+        ends = numpy.cumsum(numpy.where(starts, 3, 1)) - 1
+        clipped_x = numpy.full(ends[-1] + 1 if len(ends) else 0, numpy.nan)
+        clipped_y = clipped_x.copy()
+
+        clipped_x[ends], clipped_y[ends] = end_x, end_y
+        clipped_x[ends[starts] - 1], clipped_y[ends[starts] - 1] = cut_x[starts], cut_y[starts]
+
+        return clipped_x, clipped_y
+
+    def _draw_polylines(self, screen_x: numpy.ndarray, screen_y: numpy.ndarray, color):
+        """Draw the points as lines, broken where the values are not finite"""
+
+        points = numpy.column_stack((screen_x, screen_y))
+        finite = numpy.isfinite(screen_y)
+
+        for line in numpy.split(points, numpy.flatnonzero(~finite)):
+            line = line[numpy.isfinite(line[:, 1])]
+
+            if len(line) >= 2:
+                pygame.draw.lines(self.canvas, color, False, line.tolist(), 2)
+
+    def _graph_rectangle(self, canvas_position: Tuple[int, int, int, int]) -> evaluation.Rectangle:
+        """Get the rectangle of the graph in canvas, (x_min, x_max, y_min, y_max)"""
+
+        canvas_x, canvas_y, width, height = canvas_position
+
+        return ((canvas_x - self.origin.x) / self.scale, \
+                (canvas_x + width - self.origin.x) / self.scale, \
+                (self.origin.y - canvas_y - height) / self.scale, \
+                (self.origin.y - canvas_y) / self.scale)
+
+    def _is_dense(self, points: spatial.PointIndex, \
+                  canvas_position: Tuple[int, int, int, int]) -> bool:
+        """Check if the points in canvas are over the threshold by pixel, drawn as a heatmap"""
+
+        width, height = canvas_position[2:]
+
+        # Fewer points than the threshold can't be dense in any view
+        max_points = self.DENSITY_THRESHOLD * width * height
+
+        if len(points) <= max_points:
+            return False
+
+        counts = points.pyramid().window(*self._graph_rectangle(canvas_position), 1 / self.scale)[1]
+        return counts.sum() > max_points
+
+    def _draw_points(self, points: spatial.PointIndex, \
+                     canvas_position: Tuple[int, int, int, int], dense: Union[bool, None]=None):
+        """
+        Draw the points of the index in the canvas with a single blits, the others aren't read.
+        They are drawn as a heatmap if dense, by default if they are dense in canvas
+        """
+
+        canvas_x, canvas_y, width, height = canvas_position
+        rectangle = self._graph_rectangle(canvas_position)
+
+        if dense is None:
+            dense = self._is_dense(points, canvas_position)
+
+        if dense:
+            level, counts, area = points.pyramid().window(*rectangle, 1 / self.scale)
+            self._draw_density(counts, area, points.pyramid().peaks[level])
+            self.profiler.count('density cells', counts.size)
+            return
+
+        visible = points.query(*rectangle)
+
+        screen_x, screen_y = self.to_screen(visible[:, 0], visible[:, 1])
+
+        # The dots on the borders of canvas aren't drawn
+        inside = (0 < screen_x - canvas_x) & (screen_x - canvas_x < width) & \
+            (0 < screen_y - canvas_y) & (screen_y - canvas_y < height)
+
+        # The sprite is blitted where pygame.draw.circle would draw the dot
+        positions = numpy.column_stack((screen_x[inside], screen_y[inside]))
+        positions = numpy.floor(positions - self.POINT_RADIUS).astype(int)
+
+        if self._point_sprite is None:
+            self._point_sprite = self._make_point_sprite(self.POINT_COLOR, self.POINT_RADIUS)
+
+        self.canvas.blits(zip(itertools.repeat(self._point_sprite), positions.tolist()), \
+                          doreturn=False)
+
+        if self.profiler.enabled:
+            self.profiler.count('points drawn', len(positions))
+            self.profiler.count('points culled', len(points) - len(positions))
+
+    def _draw_density(self, counts: numpy.ndarray, area: evaluation.Rectangle, peak: int):
+        """
+        Draw the counts of points as a heatmap over area, in the graph coordinates. The
+        opacity of each cell grows with the logarithm of its count, up to peak
+        """
+
+        # surfarray is indexed by [x, y], with y going down
+        counts = counts[::-1].T
+
+        surface = pygame.Surface(counts.shape, pygame.constants.SRCALPHA)
+        surface.fill(pygame.Color(self.POINT_COLOR))
+
+        alpha = pygame.surfarray.pixels_alpha(surface)
+        alpha[:] = numpy.where(counts > 0, self.DENSITY_MIN_ALPHA + \
+                               (255 - self.DENSITY_MIN_ALPHA) * numpy.log1p(counts) / \
+                               numpy.log1p(max(peak, 1)), 0).astype(numpy.uint8)
+        del alpha
+
+        self._blit_area(surface, area)
+
+    @staticmethod
+    def _make_point_sprite(color, radius: int) -> pygame.Surface:
+        """Create the marker of the dots, a circle with a transparent colorkey around it"""
+
+        sprite = pygame.Surface((2 * radius + 1, 2 * radius + 1))
+        sprite.fill(DrawGraph.SPRITE_COLORKEY)
+        sprite.set_colorkey(DrawGraph.SPRITE_COLORKEY)
+
+        pygame.draw.circle(sprite, color, (radius, radius), radius)
+        return sprite
 
 
 class Screen:
@@ -80,6 +582,11 @@ class Screen:
 
     FPS = 30
 
+    GRAPH = 'graph'
+    SENTENCES_TAB = 'sentences tab'
+
+    PROFILE_LOG = 'eq-profile.csv'
+
     def __init__(self, width: int, height: int):
         pygame.init()
         pygame.font.init()
@@ -91,6 +598,12 @@ class Screen:
         self.clock = pygame.time.Clock()
         self.font: pygame.font.Font = pygame.font.SysFont('mono', 30)
 
+        # Toggled with F3, and its frame log is saved with F4
+        self.profiler = profiling.Profiler()
+        self.profiler_font: pygame.font.Font = pygame.font.SysFont('mono', 14)
+
+        self.text_cache = text_cache.TextCache(self.font, profiler=self.profiler)
+
         self.running: bool = False
 
         self.universe: sentences.Universe = sentences.Universe()
@@ -99,7 +612,29 @@ class Screen:
         self.dragging = None
 
         origin = pygame.Vector2(width / 2, height / 2)
-        self.draw_universe: DrawGraph = DrawGraph(self.canvas, self.universe, origin, 100)
+        self.draw_universe: DrawGraph = DrawGraph(self.canvas, self.universe, origin, 100, \
+                                                  self.profiler, tile_cache.TileCache())
+
+        # Regions of the screen that must be repainted
+        self.dirty: Set[str] = {self.GRAPH, self.SENTENCES_TAB}
+
+        # The graph is evaluated in a thread, the last snapshot is drawn meanwhile
+        self.snapshot_event = pygame.event.custom_type()
+        self.worker = evaluation.EvaluationWorker(
+            lambda: pygame.event.post(pygame.event.Event(self.snapshot_event))
+        )
+
+        # The error of the last evaluation, shown under the sentences until one succeeds
+        self.status: Union[str, None] = None
+
+        # The view of the last job, and the copy of the universe interpreter of its version
+        self._job_key: Union[tuple, None] = None
+        self._variables: Union[parser.Interpreter, None] = None
+        self._variables_version = -1
+
+        # Only used by the worker, it takes the variables of each version keeping its cache
+        self._interpreter = parser.Interpreter(self.universe.interpreter.flat)
+        self._interpreter_version = -1
 
     def __repr__(self) -> str:
         cls = self.__class__
@@ -111,37 +646,83 @@ class Screen:
 
         self.running = True
 
-        while self.running:
-            self._lister_events()
-            self._draw()
-            self.clock.tick(self.FPS)
+        try:
+            while self.running:
+                # Sleep until something happens, nothing has to be repainted
+                if not self.dirty:
+                    self._handle_event(pygame.event.wait())
+
+                self.profiler.start_frame()
+
+                with self.profiler.timer('events'):
+                    self._lister_events()
+
+                if self.dirty:
+                    self._draw()
+
+                self.profiler.end_frame()
+                self.clock.tick(self.FPS)
+        finally:
+            self.worker.stop()
 
     def _lister_events(self):
         for event in pygame.event.get():
-            if event.type == pygame.constants.QUIT:
-                self.running = False
-            elif event.type == pygame.constants.KEYDOWN:
-                self.on_keydown(event)
+            self._handle_event(event)
 
-            elif event.type == pygame.constants.MOUSEWHEEL:
-                new_scale = self.draw_universe.scale * (event.y / 10 + 1)
+    def _handle_event(self, event):
+        universe_version = self.universe.version
 
-                if 150 > new_scale > 10:
-                    self.draw_universe.scale = new_scale
+        if event.type == pygame.constants.QUIT:
+            self.running = False
+        elif event.type == pygame.constants.KEYDOWN:
+            self.on_keydown(event)
+            self.dirty.add(self.SENTENCES_TAB)
+
+        elif event.type == pygame.constants.MOUSEWHEEL:
+            # The zoom goes by the levels of the tiles, so they are drawn without scaling
+            tiles = self.draw_universe.tiles
+            new_scale = tiles.level_scale(tiles.nearest_level(self.draw_universe.scale) + event.y)
+
+            if 150 > new_scale > 10:
+                self.draw_universe.scale = new_scale
+                self.dirty.add(self.GRAPH)
+
+        elif event.type == pygame.constants.MOUSEBUTTONDOWN:
+            if event.button == 1:
+                self.dragging = { 'last_pos': event.pos }
+
+        elif event.type == pygame.constants.MOUSEBUTTONUP:
+            if event.button == 1:
+                self.dragging = None
+
+        elif event.type == pygame.constants.MOUSEMOTION:
+            if self.dragging is not None:
+                new_position = pygame.Vector2(event.pos[0], event.pos[1])
+                self.draw_universe.add_position(new_position - self.dragging['last_pos'])
+                self.dragging['last_pos'] = new_position
+                self.dirty.add(self.GRAPH)
+
+        elif event.type == self.snapshot_event:
+            # The evaluation failed in the worker, the last snapshot is still drawn
+            if self.worker.error is not None:
+                error = self.worker.error
+                self.status = f'{error.__class__.__name__}: {error}'
+                print(self.status)
+            else:
+                snapshot = self.worker.snapshot
+                self.status = None
+                self.universe.report_errors(snapshot.errors)
+                self.profiler.merge(snapshot.timers, snapshot.counters)
+                self.profiler.count('snapshots')
 
-            elif event.type == pygame.constants.MOUSEBUTTONDOWN:
-                if event.button == 1:
-                    self.dragging = { 'last_pos': event.pos }
+            self.dirty.add(self.GRAPH)
 
-            elif event.type == pygame.constants.MOUSEBUTTONUP:
-                if event.button == 1:
-                    self.dragging = None
+        elif event.type in (pygame.constants.VIDEORESIZE, pygame.constants.VIDEOEXPOSE, \
+                            pygame.constants.WINDOWSHOWN, pygame.constants.WINDOWRESTORED):
+            self.dirty.update((self.GRAPH, self.SENTENCES_TAB))
 
-            elif event.type == pygame.constants.MOUSEMOTION:
-                if self.dragging is not None:
-                    new_position = pygame.Vector2(event.pos[0], event.pos[1])
-                    self.draw_universe.add_position(new_position - self.dragging['last_pos'])
-                    self.dragging['last_pos'] = new_position
+        if self.universe.version != universe_version:
+            self.dirty.add(self.GRAPH)
 
     def on_keydown(self, event):
         """Handle keydown events"""
@@ -149,6 +730,14 @@ class Screen:
         if event.key == pygame.constants.K_ESCAPE:
             self.running = False
 
+        elif event.key == pygame.constants.K_F3:
+            self.profiler.toggle()
+            self.dirty.add(self.GRAPH)
+
+        elif event.key == pygame.constants.K_F4:
+            self.profiler.export(self.PROFILE_LOG)
+            print(f'frame times saved in {self.PROFILE_LOG}')
+
         elif event.key == pygame.constants.K_HOME:
             self.sentence_cursor_pos = 0
 
@@ -166,7 +755,7 @@ class Screen:
 
         elif event.key == pygame.constants.K_UP:
             if event.mod & pygame.constants.KMOD_CTRL:
-                self.universe.selected = 0
+                self.universe.select(0)
             else:
                 self.universe.parse_selected()
                 self.universe.select(self.universe.selected-1)
@@ -231,25 +820,90 @@ class Screen:
                 self.sentence_cursor_pos += 1
 
     def _draw(self):
+        """Repaint the dirty regions, presenting them in a single update"""
+
         window_width, window_height = self.canvas.get_width(), self.canvas.get_height()
         sentence_tab_width = min(400, int(window_width / 2))
+        tab = pygame.Rect(0, 0, sentence_tab_width, window_height)
+
+        if self.GRAPH in self.dirty:
+            # The sentences tab is over the graph, so both are repainted
+            canvas_position = (0, 0, window_width, window_height)
+            self.draw_universe.draw_snapshot(self.worker.snapshot, canvas_position)
+            self._submit_evaluation(canvas_position)
+            self._draw_sentences_tab(tab)
+            self._draw_profiler()
+            pygame.display.update()
+
+        elif self.SENTENCES_TAB in self.dirty:
+            self._draw_sentences_tab(tab)
+            pygame.display.update([tab, self._draw_profiler()])
+
+        self.dirty.clear()
+
+    def _submit_evaluation(self, canvas_position: Tuple[int, int, int, int]):
+        """Evaluate the graph in the worker, if the universe or the view changed"""
+
+        graph = self.draw_universe
+        version = self.universe.version
+
+        if graph.tiles.level(graph.scale) is None:
+            origin, area = (graph.origin.x, graph.origin.y), canvas_position
+        else:
+            # Only the tiles that aren't cached, in the pixels of the zoom level
+            origin, area = (0.0, 0.0), graph.missing_area(canvas_position)
+            if area is None:
+                return
+
+        key = (version, origin, graph.scale, area)
+        if key == self._job_key:
+            return
+        self._job_key = key
+
+        # The interpreter of the universe changes while the worker evaluates
+        if self._variables is None or self._variables_version != version:
+            self._variables = self.universe.interpreter.copy()
+            self._variables_version = version
+
+        # The worker measures the job apart, the snapshot brings it to the frame that accepts it
+        profiler = profiling.Profiler(self.profiler.enabled)
+        evaluator = evaluation.Evaluator(self._interpreter, origin, graph.scale, area, profiler)
+        universe, variables = self.universe, self._variables
 
-        self.canvas.fill('white')
+        def job(cancelled: Callable[[], bool]) -> Union[evaluation.Snapshot, None]:
+            with profiler.timer('evaluate'):
+                if self._interpreter_version != version:
+                    self._interpreter.update(variables)
+                    self._interpreter_version = version
 
-        self.draw_universe.draw((0, 0, window_width, window_height))
-        self._draw_sentences_tab(pygame.Rect(0, 0, sentence_tab_width, window_height))
+                snapshot = evaluator.snapshot((universe, version), self.worker.snapshot, \
+                                              cancelled)
 
-        pygame.display.update()
-        pygame.display.flip()
+            if snapshot is None:
+                return None
+            return snapshot._replace(timers=profiler.timers, counters=profiler.counters)
+
+        self.worker.submit(job)
+
+    def _draw_profiler(self) -> Union[pygame.Rect, None]:
+        """Draw the profiler overlay if it's enabled, returning the area changed"""
+
+        if not self.profiler.enabled:
+            return None
+        return self.profiler.draw_overlay(self.canvas, self.profiler_font)
 
     def _draw_sentences_tab(self, tab: pygame.Rect):
+        with self.profiler.timer('sentences tab'):
+            self._draw_sentences(tab)
+
+    def _draw_sentences(self, tab: pygame.Rect):
         pygame.draw.rect(self.canvas, 'black', tab)
         pygame.draw.rect(self.canvas, 'white', (tab.x +2, tab.y +2, tab.width -4, tab.height -4))
 
         pygame.draw.rect(self.canvas, 'gray', (10, tab.y + 40 * self.universe.selected + 20, 5, 30))
 
         before_cursor_content = str(self.universe.get_selected())[:self.sentence_cursor_pos]
-        cursor_pos = self.font.render(before_cursor_content, False, 'black').get_width()
+        cursor_pos = self.text_cache.width(before_cursor_content)
         cursor_position = (cursor_pos +20, tab.y + 40 * self.universe.selected + 20, 2, 30)
         pygame.draw.rect(self.canvas, 'gray', cursor_position)
 
@@ -260,13 +914,13 @@ class Screen:
                 if isinstance(sentence.error_data, dict) and \
                    sentence.error_data['position'] < len(text):
                     before_error = text[:sentence.error_data['position']]
-                    error_x = self.font.render(before_error, False, 'black').get_width()
+                    error_x = self.text_cache.width(before_error)
 
                     error_content = text[
                         sentence.error_data['position']: \
                         sentence.error_data['position']+sentence.error_data['length']
                     ]
-                    error_width = self.font.render(error_content, False, 'black').get_width()
+                    error_width = self.text_cache.width(error_content)
 
                     error_position = (error_x +20, tab.y + 40 * index + 52, error_width, 3)
                 else:
@@ -274,5 +928,10 @@ class Screen:
 
                 pygame.draw.rect(self.canvas, 'red', error_position)
 
-            text = self.font.render(text, True, 'black')
+            text = self.text_cache.render(text, True, 'black')
             self.canvas.blit(text, (tab.x + 20, tab.y + 40 * index + 20))
+
+        if self.status is not None:
+            status = self.profiler_font.render(self.status, True, 'red')
+            self.canvas.blit(status, (tab.x + 20, tab.bottom - status.get_height() - 10), \
+                             (0, 0, tab.width - 40, status.get_height()))
@@ -0,0 +1,81 @@
+"""Marching squares, to find the zero contour of values sampled in a grid"""
+
+from typing import Tuple
+import numpy
+
+# Edges of a cell: 0 top, 1 right, 2 bottom, 3 left
+# Corners of a cell: 1 top left, 2 top right, 4 bottom right, 8 bottom left
+SEGMENTS = {
+    1: ((3, 0),),
+    2: ((0, 1),),
+    3: ((3, 1),),
+    4: ((1, 2),),
+    6: ((0, 2),),
+    7: ((3, 2),),
+    8: ((2, 3),),
+    9: ((0, 2),),
+    11: ((1, 2),),
+    12: ((1, 3),),
+    13: ((0, 1),),
+    14: ((3, 0),)
+}
+
+# Saddle cells, resolved by the sign of the cell center: (center positive, center negative)
+SADDLE_SEGMENTS = {
+    5: (((0, 1), (2, 3)), ((3, 0), (1, 2))),
+    10: (((3, 0), (1, 2)), ((0, 1), (2, 3)))
+}
+
+def marching_squares(values: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Find the segments where the values cross zero, all cells in a single pass.
+    values is indexed by [row, column], the segments are returned as an array of
+    shape (n, 2, 2) with the (column, row) of both ends, interpolated in the grid.
+    It also returns, for each end, the smaller absolute value at the corners of its
+    edge: at a zero the function in the end is smaller than it, across a pole it isn't
+    """
+
+    top_left, top_right = values[:-1, :-1], values[:-1, 1:]
+    bottom_right, bottom_left = values[1:, 1:], values[1:, :-1]
+
+    rows, columns = numpy.indices(top_left.shape, dtype=float)
+
+    with numpy.errstate(all='ignore'):
+        edges = (
+            (columns + top_left / (top_left - top_right), rows),
+            (columns + 1, rows + top_right / (top_right - bottom_right)),
+            (columns + bottom_left / (bottom_left - bottom_right), rows + 1),
+            (columns, rows + top_left / (top_left - bottom_left))
+        )
+
+    limits = (
+        numpy.minimum(numpy.abs(top_left), numpy.abs(top_right)),
+        numpy.minimum(numpy.abs(top_right), numpy.abs(bottom_right)),
+        numpy.minimum(numpy.abs(bottom_left), numpy.abs(bottom_right)),
+        numpy.minimum(numpy.abs(top_left), numpy.abs(bottom_left))
+    )
+
+    cases = (top_left > 0) * 1 | (top_right > 0) * 2 | (bottom_right > 0) * 4 \
+          | (bottom_left > 0) * 8
+    cases[~numpy.isfinite(top_left + top_right + bottom_right + bottom_left)] = 0
+
+    center_positive = top_left + top_right + bottom_right + bottom_left > 0
+
+    segments, segments_limits = [], []
+
+    def add_segments(cells: numpy.ndarray, pairs):
+        for start, end in pairs:
+            segments.append(numpy.stack((
+                numpy.stack((edges[start][0][cells], edges[start][1][cells]), axis=-1),
+                numpy.stack((edges[end][0][cells], edges[end][1][cells]), axis=-1)
+            ), axis=1))
+            segments_limits.append(numpy.stack((limits[start][cells], limits[end][cells]), axis=1))
+
+    for case, pairs in SEGMENTS.items():
+        add_segments(cases == case, pairs)
+
+    for case, (positive_pairs, negative_pairs) in SADDLE_SEGMENTS.items():
+        add_segments((cases == case) & center_positive, positive_pairs)
+        add_segments((cases == case) & ~center_positive, negative_pairs)
+
+    return numpy.concatenate(segments), numpy.concatenate(segments_limits)
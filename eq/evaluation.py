@@ -0,0 +1,332 @@
+"""Evaluation of the values of a universe in a view, and a worker thread that runs it"""
+
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple, Union
+import numpy
+from . import contour
+from . import parser
+from . import profiling
+from . import sampling
+from . import spatial
+
+Rectangle = Tuple[float, float, float, float]
+
+class Curve(NamedTuple):
+    """Samples of a curve in the graph coordinates, broken where y isn't finite"""
+
+    x_values: numpy.ndarray
+    y_values: numpy.ndarray
+
+class Implicit(NamedTuple):
+    """
+    Segments of an implicit curve in the graph coordinates, shape (n, 2, 2). The region
+    is the mask of the grid by [row, column], a block of area for each grid point
+    """
+
+    segments: numpy.ndarray
+    region: Union[numpy.ndarray, None]
+    area: Rectangle
+
+class Snapshot(NamedTuple):
+    """
+    The evaluated geometry of a version of a universe, it isn't changed after created.
+    errors has the error data of the values that went over the evaluation budget.
+    The curves were sampled with scale, inside area of the graph
+    """
+
+    key: Tuple[Any, int]
+    layers: Tuple[Union[Curve, Implicit], ...]
+    points: spatial.PointIndex
+    errors: Dict[parser.GenericValue, parser.ErrorData]
+    scale: float
+    area: Rectangle
+
+    # Timers and counters of an evaluation measured apart, like in a worker,
+    # added to the frame that accepts it. They are empty if it wasn't measured apart
+    timers: Dict[str, float]
+    counters: Dict[str, int]
+
+def _frozen(array: numpy.ndarray) -> numpy.ndarray:
+    array.flags.writeable = False
+    return array
+
+class Evaluator:
+    """
+    Evaluate the values of interpreter in a view, the graph with origin and scale
+    drawn in canvas_position. The geometry is given in the graph coordinates, so
+    it can be drawn in a different view while the next one is evaluated
+    """
+
+    IMPLICIT_CELL_SIZE = 4
+
+    # Dots evaluated between the checks of cancellation
+    POINTS_BY_CHECK = 4096
+
+    def __init__(self, interpreter: parser.Interpreter, origin: Tuple[float, float], \
+                 scale: float, canvas_position: Tuple[int, int, int, int], \
+                 profiler: Union[profiling.Profiler, None]=None) -> None:
+        self.interpreter = interpreter
+        self.origin = origin
+        self.scale = scale
+        self.canvas_position = canvas_position
+        self.profiler = profiler or profiling.Profiler()
+
+        # Error data of the values over budget, found in this evaluation
+        self.errors: Dict[parser.GenericValue, parser.ErrorData] = {}
+
+    def snapshot(self, key: Tuple[Any, int], previous: Union[Snapshot, None]=None, \
+                 cancelled: Callable[[], bool]=lambda: False) -> Union[Snapshot, None]:
+        """
+        Evaluate everything, reusing the dots of previous if it has the same key, the
+        universe and its version. Returns None if cancelled returns True in the middle
+        """
+
+        layers: List[Union[Curve, Implicit]] = []
+        no_name_varname = self.interpreter.NO_NAME_VARNAME
+
+        self.errors = {}
+        self.interpreter.errors.clear()
+
+        for name, variable in self.interpreter.vars.items():
+            for value in variable if name == no_name_varname else (variable,):
+                if cancelled():
+                    return None
+
+                if isinstance(value, parser.CurveValue) and name == no_name_varname:
+                    layer = self.curve(value)
+                elif isinstance(value, parser.ImplicitValue):
+                    layer = self.implicit(value)
+                else:
+                    continue
+
+                if layer is not None:
+                    layers.append(layer)
+
+        if previous is not None and previous.key == key:
+            # The errors of the dots are the same, their values didn't change
+            points = previous.points
+            self.errors.update(previous.errors)
+        else:
+            with self.profiler.timer('index points'):
+                evaluated = self.points(cancelled)
+                if evaluated is None:
+                    return None
+                points = spatial.PointIndex(evaluated)
+
+        self.errors.update((value, error.get_error_data()) \
+                           for value, error in self.interpreter.errors.items())
+        return Snapshot(key, tuple(layers), points, self.errors, self.scale, self.area(), {}, {})
+
+    def points(self, cancelled: Callable[[], bool]=lambda: False \
+               ) -> Union[List[Tuple[float, float]], None]:
+        """Get the coordinates of all dots, the dots that can't be evaluated are skipped"""
+
+        interpreter = self.interpreter
+        dots = [value for value in interpreter.vars[interpreter.NO_NAME_VARNAME] \
+                if isinstance(value, parser.DotValue)]
+        dots.extend(value for name, value in interpreter.vars.items() \
+                    if name != interpreter.NO_NAME_VARNAME and isinstance(value, parser.DotValue))
+
+        if self.profiler.enabled:
+            self.profiler.count('node visits', sum(dot.size for dot in dots))
+
+        points = []
+
+        for index, dot in enumerate(dots):
+            if index % self.POINTS_BY_CHECK == 0 and cancelled():
+                return None
+
+            try:
+                # A dot with complex coordinates, like ((-1)^(1/2), 1), isn't drawn
+                dot_x, dot_y = dot.get_value(interpreter)
+                points.append((float(dot_x), float(dot_y)))
+            except parser.EvaluationBudgetError as error:
+                self._over_budget(dot, error)
+            except (parser.UndefinedVariableError, parser.UnexpectedVariableTypeError, \
+                    parser.CircularDefinitionError, ArithmeticError, TypeError, \
+                    RecursionError) as error:
+                print(error)
+
+        return points
+
+    def to_graph(self, screen_x: numpy.ndarray, screen_y: numpy.ndarray \
+                 ) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """Convert screen coordinates of the view to graph coordinates"""
+
+        origin_x, origin_y = self.origin
+        return (screen_x - origin_x) / self.scale, (origin_y - screen_y) / self.scale
+
+    def area(self) -> Rectangle:
+        """Get the rectangle of the graph in the canvas, (x_min, x_max, y_min, y_max)"""
+
+        canvas_x, canvas_y, width, height = self.canvas_position
+        left, top = self.to_graph(canvas_x, canvas_y)
+        right, bottom = self.to_graph(canvas_x + width, canvas_y + height)
+        return (left, right, bottom, top)
+
+    def curve(self, curve: parser.CurveValue) -> Union[Curve, None]:
+        """Sample the curve in the pixels of the canvas, None if it can't be evaluated"""
+
+        canvas_x, canvas_y, width, height = self.canvas_position
+
+        def function(screen_x: numpy.ndarray) -> numpy.ndarray:
+            world_x = self.to_graph(screen_x, 0)[0]
+            world_y = curve.get_values(self.interpreter, world_x)
+            return self.origin[1] - numpy.asarray(world_y, dtype=float) * self.scale
+
+        try:
+            # The adaptive sampling evaluates about a point by pixel of the canvas
+            self.interpreter.check_budget(curve, width)
+            screen_x, screen_y = sampling.adaptive_sample(
+                function, canvas_x, canvas_x + width, visible=(canvas_y, canvas_y + height)
+            )
+        except parser.EvaluationBudgetError as error:
+            self._over_budget(curve, error)
+            return None
+        except (parser.UndefinedVariableError, parser.UnexpectedVariableTypeError, \
+                parser.CircularDefinitionError, ArithmeticError, TypeError, \
+                RecursionError) as error:
+            print(error)
+            return None
+
+        self.profiler.count('curve samples', len(screen_x))
+        self.profiler.count('node visits', curve.size * len(screen_x))
+
+        return Curve(*(_frozen(values) for values in self.to_graph(screen_x, screen_y)))
+
+    def implicit(self, implicit: parser.ImplicitValue) -> Union[Implicit, None]:
+        """Trace the implicit curve, and its region, None if it can't be evaluated"""
+
+        try:
+            values = self._evaluate_grid(implicit, self.IMPLICIT_CELL_SIZE)
+            self.profiler.count('node visits', implicit.size * values.size)
+
+            segments, limits = contour.marching_squares(values)
+            segments = self._remove_poles(implicit, segments, limits)
+        except parser.EvaluationBudgetError as error:
+            self._over_budget(implicit, error)
+            return None
+        except (parser.UndefinedVariableError, parser.UnexpectedVariableTypeError, \
+                parser.CircularDefinitionError, ArithmeticError, TypeError, \
+                RecursionError) as error:
+            print(error)
+            return None
+
+        region = None
+        if isinstance(implicit, parser.RegionValue):
+            region = _frozen(numpy.array(implicit.contains(values)))
+
+        # Each grid point is the center of its block
+        cell_size = self.IMPLICIT_CELL_SIZE
+        left, top = self.to_graph(self.canvas_position[0] - cell_size // 2, \
+                                  self.canvas_position[1] - cell_size // 2)
+        right = left + values.shape[1] * cell_size / self.scale
+        bottom = top - values.shape[0] * cell_size / self.scale
+
+        return Implicit(_frozen(segments), region, (left, right, bottom, top))
+
+    def _over_budget(self, value: parser.GenericValue, error: parser.EvaluationBudgetError):
+        print(error)
+        self.errors[value] = error.get_error_data()
+
+    def _evaluate_grid(self, value: parser.GenericValue, cell_size: int) -> numpy.ndarray:
+        """
+        Evaluate the function of value in a grid over canvas, with cells of cell_size pixels.
+        The cost depends of the canvas area, not of the scale
+        """
+
+        canvas_x, canvas_y, width, height = self.canvas_position
+
+        screen_x = numpy.arange(canvas_x, canvas_x + width + cell_size, cell_size, dtype=float)
+        screen_y = numpy.arange(canvas_y, canvas_y + height + cell_size, cell_size, dtype=float)
+
+        world_x, world_y = numpy.meshgrid(*self.to_graph(screen_x, screen_y))
+        self.interpreter.check_budget(value, world_x.size)
+
+        with numpy.errstate(all='ignore'):
+            values = value.get_values(self.interpreter, world_x, world_y)
+            return numpy.broadcast_to(numpy.asarray(values, dtype=float), world_x.shape)
+
+    def _remove_poles(self, implicit: parser.ImplicitValue, segments: numpy.ndarray, \
+                      limits: numpy.ndarray) -> numpy.ndarray:
+        """
+        Convert the segments of grid to the graph, removing the sign changes across poles,
+        where the function at the segment ends isn't smaller than the limits
+        """
+
+        segments = segments * self.IMPLICIT_CELL_SIZE + self.canvas_position[:2]
+        world_x, world_y = self.to_graph(segments[:, :, 0], segments[:, :, 1])
+
+        with numpy.errstate(all='ignore'):
+            ends = implicit.get_values(self.interpreter, world_x, world_y)
+            ends = numpy.abs(numpy.broadcast_to(numpy.asarray(ends, dtype=float), world_x.shape))
+
+        kept = (ends <= limits).all(axis=1)
+        return numpy.stack((world_x[kept], world_y[kept]), axis=-1)
+
+class EvaluationWorker:
+    """
+    Thread that runs the last submitted job and publishes its snapshot, calling notify.
+    A job submitted while another one runs cancels it, only the last one matters
+    """
+
+    def __init__(self, notify: Callable[[], None]) -> None:
+        self.notify = notify
+
+        # The last published snapshot, and the error of the last job if it failed
+        self.snapshot: Union[Snapshot, None] = None
+        self.error: Union[Exception, None] = None
+
+        self._condition = threading.Condition()
+        self._job: Union[Callable[[Callable[[], bool]], Union[Snapshot, None]], None] = None
+        self._generation = 0
+        self._running = True
+
+        self._thread = threading.Thread(target=self._run, name='eq evaluation', daemon=True)
+        self._thread.start()
+
+    def submit(self, job: Callable[[Callable[[], bool]], Union[Snapshot, None]]):
+        """
+        Run job in the worker, replacing the job waiting or running. job gets a function
+        that returns True once it's cancelled, and returns the snapshot or None
+        """
+
+        with self._condition:
+            self._job = job
+            self._generation += 1
+            self._condition.notify()
+
+    def stop(self):
+        """Cancel the job and wait the thread to finish"""
+
+        with self._condition:
+            self._running = False
+            self._generation += 1
+            self._condition.notify()
+
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._job is None and self._running:
+                    self._condition.wait()
+
+                if not self._running:
+                    return
+
+                job, generation = self._job, self._generation
+                self._job = None
+
+            try:
+                snapshot = job(lambda generation=generation: self._generation != generation)
+            except Exception as error: # pylint: disable=broad-except
+                # The error is shown by the screen, the worker keeps running the next jobs
+                self.error = error
+                self.notify()
+                continue
+
+            if snapshot is not None:
+                self.snapshot = snapshot
+                self.error = None
+                self.notify()
@@ -0,0 +1,92 @@
+"""Render documents of sentences without a display, exporting the graphs as PNG images"""
+
+import argparse
+import os
+from typing import Iterable, Tuple
+import pygame
+from . import DrawGraph
+from . import sentences
+
+Viewport = Tuple[float, float, float, float]
+
+class Renderer:
+    """
+    Render universes in an off-screen surface. pygame is initialized only once,
+    so many documents can be rendered by the same process
+    """
+
+    def __init__(self, width: int, height: int) -> None:
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        pygame.init()
+
+        self.canvas = pygame.Surface((width, height))
+        self.draw_graph = DrawGraph(self.canvas, sentences.Universe(), pygame.Vector2(), 1)
+
+    def render(self, universe: sentences.Universe, viewport: Viewport) -> pygame.Surface:
+        """
+        Draw the universe in the canvas. viewport is (x_min, x_max, y_min, y_max) in the
+        graph coordinates, it's centered and fitted in the canvas keeping the aspect ratio
+        """
+
+        width, height = self.canvas.get_size()
+        x_min, x_max, y_min, y_max = viewport
+
+        scale = min(width / (x_max - x_min), height / (y_max - y_min))
+        center_x, center_y = (x_min + x_max) / 2, (y_min + y_max) / 2
+
+        self.draw_graph.universe = universe
+        self.draw_graph.scale = scale
+        self.draw_graph.origin = pygame.Vector2(width / 2 - center_x * scale, \
+                                                height / 2 + center_y * scale)
+
+        self.draw_graph.draw((0, 0, width, height))
+        return self.canvas
+
+    def render_lines(self, lines: Iterable[str], viewport: Viewport, output: str):
+        """Load the lines in a new universe, render it and save as image in output"""
+
+        universe = sentences.Universe()
+        universe.load(lines)
+
+        pygame.image.save(self.render(universe, viewport), output)
+
+    def render_file(self, path: str, viewport: Viewport, output: str):
+        """
+        Render the document of path, one sentence by line, and save as image in output.
+        The lines of big documents are parsed in parallel
+        """
+
+        universe = sentences.Universe()
+        universe.load_file(path)
+
+        pygame.image.save(self.render(universe, viewport), output)
+
+def main(args=None):
+    """Render each document given in the command line as a PNG image"""
+
+    arg_parser = argparse.ArgumentParser(prog='python -m eq.headless', description=__doc__)
+    arg_parser.add_argument('documents', nargs='+', help='files with one sentence by line')
+    arg_parser.add_argument('--size', default='800x600', help='image size, like 800x600')
+    arg_parser.add_argument('--viewport', nargs=4, type=float, default=[-5, 5, -5, 5], \
+                            metavar=('X_MIN', 'X_MAX', 'Y_MIN', 'Y_MAX'), help='graph area')
+    arg_parser.add_argument('--output-dir', default='.', help='directory of the images')
+    args = arg_parser.parse_args(args)
+
+    width, height = (int(value) for value in args.size.lower().split('x'))
+    viewport = tuple(args.viewport)
+
+    if viewport[0] >= viewport[1] or viewport[2] >= viewport[3]:
+        arg_parser.error('the viewport must have X_MIN < X_MAX and Y_MIN < Y_MAX')
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    renderer = Renderer(width, height)
+
+    for document in args.documents:
+        name = os.path.splitext(os.path.basename(document))[0]
+        output = os.path.join(args.output_dir, name + '.png')
+
+        renderer.render_file(document, viewport, output)
+        print(f'{document} -> {output}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+"""Optimization pass over the parsed ASTs, between the parser and the interpreter"""
+
+import math
+from typing import Dict, List, NamedTuple, Tuple, Union
+from . import parser
+
+# Integer powers with bigger results aren't folded, computing them would stall the parsing
+MAX_FOLDED_POWER_BITS = 4096
+
+# Optimized parenthesized groups by their LPAREN token, like parser.Groups:
+# (node of the parse, optimized node, optimized groups inside it)
+OptimizedGroups = Dict[parser.Token, Tuple[parser.GenericNode, parser.GenericNode, Dict]]
+
+class FoldedToken(parser.Token):
+    """
+    Token of a folded number, from the first to the last token it was folded from. They
+    are tokens of the sentence, so it moves with them when an edit before it is relexed
+    """
+
+    __slots__ = ('first', 'last')
+
+    def __init__(self, type_: parser.TokenType, value, first: parser.Token, \
+                 last: parser.Token) -> None:
+        # pylint: disable=super-init-not-called
+        self.type = type_
+        self.value = value
+
+        self.first = first.first if isinstance(first, FoldedToken) else first
+        self.last = last.last if isinstance(last, FoldedToken) else last
+
+    @property
+    def position(self) -> int:
+        """Position of the first char"""
+        return self.first.position
+
+    @property
+    def length(self) -> int:
+        """Count of chars to the last char"""
+        return self.last.position + self.last.length - self.first.position
+
+class Scope(NamedTuple):
+    """
+    The groups of a level of the tree, outside the groups or inside one of them: the
+    groups of the parse, the optimized groups of the previous parse and of this one,
+    and the tokens of the groups by their nodes
+    """
+
+    parsed: parser.Groups
+    previous: OptimizedGroups
+    current: OptimizedGroups
+    tokens: Dict[parser.GenericNode, parser.Token]
+
+def _scope(parsed: parser.Groups, previous: OptimizedGroups) -> Scope:
+    return Scope(parsed, previous, {}, {group[0]: token for token, group in parsed.items()})
+
+class Optimizer:
+    """
+    Fold the constant subtrees in NumberNodes, and hash-cons the subtrees: identical
+    subexpressions become a single shared node, so they are evaluated once
+    """
+
+    def __init__(self) -> None:
+        # Unique nodes by their content, the children are compared by identity
+        self.nodes: Dict[tuple, parser.GenericNode] = {}
+
+        # The optimized groups of the last optimized ast
+        self.groups: OptimizedGroups = {}
+
+    def optimize(self, ast: parser.GenericNode, groups: Union[parser.Groups, None]=None, \
+                 previous: Union[OptimizedGroups, None]=None) -> parser.GenericNode:
+        """
+        Get the optimized ast, the nodes of ast aren't changed. groups are the groups of
+        the parse of ast and previous the optimized groups of a previous parse, the groups
+        that are the same nodes in both are reused without walking them again
+        """
+
+        optimized: Dict[parser.GenericNode, parser.GenericNode] = {}
+        scope = _scope(groups or {}, previous or {})
+        self.groups = scope.current
+
+        # The group of a node is where it's registered and its scope, if it's a group
+        stack: List[tuple] = [(ast, False, scope, None)]
+
+        while stack:
+            node, visited, scope, group = stack.pop()
+
+            if not visited:
+                if node in optimized:
+                    continue
+
+                token = scope.tokens.get(node)
+
+                if token is not None:
+                    cached = scope.previous.get(token)
+
+                    if cached is not None and cached[0] is node:
+                        optimized[node] = cached[1]
+                        scope.current[token] = cached
+                        continue
+
+                    outer = scope
+                    scope = _scope(scope.parsed[token][3], cached[2] if cached else {})
+                    group = (outer.current, token)
+
+                children = node.children()
+
+                if children:
+                    stack.append((node, True, scope, group))
+                    stack.extend((child, False, scope, None) for child in children)
+                    continue
+
+            children = node.children()
+            optimized[node] = self.rebuild(node, [optimized[child] for child in children])
+
+            if group is not None:
+                registered, token = group
+                registered[token] = (node, optimized[node], scope.current)
+
+        return optimized[ast]
+
+    def rebuild(self, node: parser.GenericNode, children: List[parser.GenericNode] \
+                ) -> parser.GenericNode:
+        """Get the optimized node, given its optimized children"""
+
+        if isinstance(node, parser.NumberNode):
+            return self.unique(_number_key(node.token.value), node)
+
+        if isinstance(node, parser.VariableNode):
+            return self.unique((parser.VariableNode, node.token.value), node)
+
+        if isinstance(node, parser.BinaryOperatorNode):
+            left, right = children
+
+            if isinstance(left, parser.NumberNode) and isinstance(right, parser.NumberNode):
+                folded = self.fold(node.operator, left, right)
+                if folded is not None:
+                    return folded
+
+            if left is not node.left_node or right is not node.right_node:
+                node = parser.BinaryOperatorNode(left, node.operator, right)
+            return self.unique((parser.BinaryOperatorNode, node.operator.type, left, right), node)
+
+        if isinstance(node, parser.UnaryOperatorNode):
+            operand, = children
+
+            if node.operator.type == parser.TT_PLUS:
+                return operand
+            if node.operator.type != parser.TT_MINUS:
+                return node
+
+            if isinstance(operand, parser.NumberNode):
+                return self.fold(node.operator, operand)
+
+            if operand is not node.node:
+                node = parser.UnaryOperatorNode(node.operator, operand)
+            return self.unique((parser.UnaryOperatorNode, node.operator.type, operand), node)
+
+        if isinstance(node, parser.DotNode):
+            return parser.DotNode(*children)
+
+        if isinstance(node, parser.DefineNode):
+            return parser.DefineNode(node.name, *children)
+
+        if isinstance(node, parser.RelationNode):
+            left, right = children
+            return parser.RelationNode(left, node.operator, right)
+
+        return node
+
+    def fold(self, operator: parser.Token, *operands: parser.NumberNode \
+             ) -> Union[parser.NumberNode, None]:
+        """
+        Get the NumberNode with the result of operator, None if it can't be folded.
+        Errors, like a division by zero, are left to the evaluation
+        """
+
+        values = [operand.token.value for operand in operands]
+
+        if len(values) == 1:
+            value = -values[0]
+        else:
+            left, right = values
+
+            if operator.type == parser.TT_POWER and isinstance(left, int) and \
+                isinstance(right, int) and right * left.bit_length() > MAX_FOLDED_POWER_BITS:
+                return None
+
+            try:
+                value = parser.BINARY_OPERATORS[operator.type](left, right)
+            except ArithmeticError:
+                return None
+
+        # Like a negative number to a fractional power, that is complex
+        if not isinstance(value, (int, float)):
+            return None
+
+        first = operator if operator.position < operands[0].token.position else operands[0].token
+
+        token = FoldedToken(parser.TT_INT if isinstance(value, int) else parser.TT_FLOAT, \
+                            value, first, operands[-1].token)
+        return self.unique(_number_key(value), parser.NumberNode(token))
+
+    def unique(self, key: tuple, node: parser.GenericNode) -> parser.GenericNode:
+        """Get the node already created with key, or register node for it"""
+
+        return self.nodes.setdefault(key, node)
+
+def _number_key(value) -> tuple:
+    # 0.0 and -0.0 are equal, but they aren't the same number
+    sign = math.copysign(1, value) if isinstance(value, float) else 1
+    return (parser.NumberNode, type(value), value, sign)
+
+class IncrementalOptimizer:
+    """
+    Optimize the successive ASTs of an IncrementalParser. The groups that it reused are
+    reused optimized, so only the changed groups and the nodes outside them are walked
+    """
+
+    def __init__(self) -> None:
+        self.groups: OptimizedGroups = {}
+
+    def reset(self):
+        """Forget the previous groups, so the next AST is optimized from scratch"""
+
+        self.groups = {}
+
+    def optimize(self, ast: parser.GenericNode, groups: parser.Groups) -> parser.GenericNode:
+        """Get the optimized ast, given the groups of its parse"""
+
+        optimizer = Optimizer()
+        optimized = optimizer.optimize(ast, groups, self.groups)
+
+        self.groups = optimizer.groups
+        return optimized
+
+def optimize(ast: parser.GenericNode) -> parser.GenericNode:
+    """Fold the constant subtrees and share the identical subtrees of ast"""
+
+    return Optimizer().optimize(ast)
@@ -1,29 +1,101 @@
 """Parser of sentences"""
 
-from typing import Generator, Iterator, Tuple, TypedDict, Union
+from array import array
+import enum
+import itertools
+import operator as ops
+import re
+import sys
+from typing import Any, Callable, Dict, FrozenSet, Generator, Iterator, List, Set, \
+    Tuple, TypedDict, Union
 
 ErrorData = TypedDict('ErrorData', position=int, length=int, msg=str)
 
-DIGITS = '0123456789'
-ALPHABET = 'abcdefghijklmnopqrstuvwxyz'
-
-TT_INT    = 'INT'
-TT_FLOAT  = 'FLOAT'
-TT_PLUS   = 'PLUS'
-TT_MINUS  = 'MINUS'
-TT_MUL    = 'MUL'
-TT_DIV    = 'DIV'
-TT_POWER  = 'POWER'
-TT_LPAREN = 'LP'
-TT_RPAREN = 'RP'
-TT_VAR    = 'VAR'
-TT_EOF    = 'EOF'
-TT_DEF    = 'DEF'
-TT_SEP    = 'SEP'
+class TokenType(enum.IntEnum):
+    """Type of token, an int so it's compact and fast to compare"""
+
+    INT = enum.auto()
+    FLOAT = enum.auto()
+    PLUS = enum.auto()
+    MINUS = enum.auto()
+    MUL = enum.auto()
+    DIV = enum.auto()
+    POWER = enum.auto()
+    LP = enum.auto()
+    RP = enum.auto()
+    VAR = enum.auto()
+    EOF = enum.auto()
+    DEF = enum.auto()
+    SEP = enum.auto()
+    EQ = enum.auto()
+    LT = enum.auto()
+    GT = enum.auto()
+    LTE = enum.auto()
+    GTE = enum.auto()
+
+    def __str__(self) -> str:
+        return self.name
+
+TT_INT    = TokenType.INT
+TT_FLOAT  = TokenType.FLOAT
+TT_PLUS   = TokenType.PLUS
+TT_MINUS  = TokenType.MINUS
+TT_MUL    = TokenType.MUL
+TT_DIV    = TokenType.DIV
+TT_POWER  = TokenType.POWER
+TT_LPAREN = TokenType.LP
+TT_RPAREN = TokenType.RP
+TT_VAR    = TokenType.VAR
+TT_EOF    = TokenType.EOF
+TT_DEF    = TokenType.DEF
+TT_SEP    = TokenType.SEP
+TT_EQ     = TokenType.EQ
+TT_LT     = TokenType.LT
+TT_GT     = TokenType.GT
+TT_LTE    = TokenType.LTE
+TT_GTE    = TokenType.GTE
+
+# Integer results with more bits are computed as floats, exact big integers are too slow
+MAX_INTEGER_BITS = 4096
+
+def multiply(left, right):
+    """Multiply numbers or arrays, integers as floats if the product has too many bits"""
+
+    if isinstance(left, int) and isinstance(right, int) and \
+        left.bit_length() + right.bit_length() > MAX_INTEGER_BITS:
+        return float(left) * float(right)
+    return left * right
+
+def power(left, right):
+    """Raise numbers or arrays to a power, integers as floats if the power has too many bits"""
+
+    if isinstance(left, int) and isinstance(right, int) and right > 0 and \
+        right * left.bit_length() > MAX_INTEGER_BITS:
+        return float(left) ** right
+    return left ** right
+
+BINARY_OPERATORS = {
+    TT_PLUS: ops.add,
+    TT_MINUS: ops.sub,
+    TT_MUL: multiply,
+    TT_DIV: ops.truediv,
+    TT_POWER: power
+}
+
+RELATION_OPERATORS = {
+    TT_EQ: ops.eq,
+    TT_LT: ops.lt,
+    TT_GT: ops.gt,
+    TT_LTE: ops.le,
+    TT_GTE: ops.ge
+}
 
 class Token:
     """Token to parse the sentences"""
-    def __init__(self, type_: str, position: int, value=None, length: int=1) -> None:
+
+    __slots__ = ('type', 'value', 'position', 'length')
+
+    def __init__(self, type_: TokenType, position: int, value=None, length: int=1) -> None:
         self.type = type_
         self.value = value
 
@@ -145,13 +217,44 @@ class UnexpectedVariableTypeError(GenericParseError):
 
         super().__init__(msg)
 
+class CircularDefinitionError(GenericParseError):
+    """Interpreter error"""
+
+    NAME = 'CircularDefinitionError'
+
+    def __init__(self, token: Token) -> None:
+        msg = f'Circular definition of variable: "{token.value}"'
+
+        super().__init__(msg)
+
+class EvaluationBudgetError(GenericParseError):
+    """Interpreter error, an evaluation that would be too slow or a result too large"""
+
+    NAME = 'EvaluationBudgetError'
+
+    def __init__(self, msg: str, token: Token) -> None:
+        self.token = token
+        super().__init__(f'{msg} in {token.position}')
+
+    def get_error_data(self):
+        """Generate the error data"""
+
+        return ErrorData(
+            position=self.token.position,
+            length=self.token.length,
+            msg=str(self)
+        )
+
 class InternalInterpreterError(GenericParseError):
     """Interpreter error"""
 
     NAME = 'InternalInterpreterError'
 
 class Lexer:
-    """Tokenize the sentence"""
+    """
+    Tokenize the sentence with a single compiled regex, dispatching on the matched
+    group instead of advancing and concatenating char by char
+    """
 
     TOKENS_TYPES = {
         '+': TT_PLUS,
@@ -162,84 +265,190 @@ class Lexer:
         ')': TT_RPAREN,
         ',': TT_SEP,
         '^': TT_POWER,
-        ':': TT_DEF
+        ':': TT_DEF,
+        '=': TT_EQ,
+        '<': TT_LT,
+        '>': TT_GT,
+        '<=': TT_LTE,
+        '>=': TT_GTE
     }
 
-    def __init__(self, sentence) -> None:
-        self.sentence = sentence
-        self.index = -1
-        self.current_char = None
-        self.advance()
+    # Names are ASCII letters and digits, and KELVIN SIGN, the only other char with an ASCII lower()
+    PATTERN = re.compile('|'.join((
+        r'(?P<number>[0-9]+(?:\.[0-9]*)?)',
+        r'(?P<var>[A-Za-z\u212a][A-Za-z0-9\u212a]*)',
+        '(?P<operator>' + '|'.join(
+            re.escape(operator) for operator in sorted(TOKENS_TYPES, key=len, reverse=True)
+        ) + ')',
+        '(?P<space> +)',
+        '(?P<illegal>.)'
+    )), re.DOTALL)
 
-    def advance(self):
-        """Advance the index and update the current_char"""
+    # Index of each group of PATTERN, to dispatch on match.lastindex
+    NUMBER, VAR, OPERATOR, SPACE, ILLEGAL = range(1, 6)
 
-        self.index += 1
-        if self.index < len(self.sentence):
-            self.current_char = self.sentence[self.index]
-        else:
-            self.current_char = None
+    def __init__(self, sentence) -> None:
+        self.sentence = sentence
 
     def make_tokens(self) -> Generator[Token, None, None]:
         """Get all tokens of sentence"""
 
-        while self.current_char is not None:
-            if self.current_char in DIGITS:
-                yield self.make_numbers()
+        yield from self.scan(0)
+        yield Token(TT_EOF, len(self.sentence))
 
-            elif self.current_char.lower() in ALPHABET:
-                yield self.make_var()
+    def scan(self, position: int) -> Generator[Token, None, None]:
+        """Get the tokens of sentence from position, without the EOF"""
 
-            elif self.current_char in self.TOKENS_TYPES:
-                yield Token(self.TOKENS_TYPES[self.current_char], self.index)
-                self.advance()
+        # Bound to locals, the loop runs once by token
+        tokens_types, intern, token = self.TOKENS_TYPES, sys.intern, Token
+        number, var, operator, space = self.NUMBER, self.VAR, self.OPERATOR, self.SPACE
 
-            elif self.current_char == ' ':
-                self.advance()
+        for match in self.PATTERN.finditer(self.sentence, position):
+            kind = match.lastindex
+
+            if kind == space:
+                continue
+
+            text = match.group()
+            position = match.start()
+
+            if kind == operator:
+                yield token(tokens_types[text], position, None, len(text))
+
+            elif kind == number:
+                if '.' in text:
+                    yield token(TT_FLOAT, position, float(text), len(text))
+                else:
+                    yield token(TT_INT, position, int(text), len(text))
+
+            elif kind == var:
+                yield token(TT_VAR, position, intern(text), len(text))
 
             else:
-                raise IllegalCharError(self.current_char, index=self.index)
+                raise IllegalCharError(text, index=position)
 
-        yield Token(TT_EOF, self.index)
+    def relex(self, tokens: List[Token], start: int, end: int, delta: int \
+              ) -> Tuple[List[Token], int, int]:
+        """
+        Get all tokens of sentence reusing tokens, the tokens of the previous sentence.
+        Only sentence[start:end] changed, the chars after it moved by delta. The tokens
+        before the change are kept, the tokens after it are moved in place, so only the
+        changed region is lexed. Returns the tokens and the range of indexes of the new ones
+        """
+
+        count = len(tokens) - 1
 
-    def make_numbers(self):
-        """Create number token (INT and FLOAT)"""
+        # A token ending before start is kept: the char that ended it didn't change
+        prefix = _bisect_tokens(tokens, count, start, lambda token: token.position + token.length)
+        suffix = _bisect_tokens(tokens, count, end - delta, lambda token: token.position)
 
-        num_str = ''
-        has_dot = False
-        position = self.index
+        position = tokens[prefix - 1].position + tokens[prefix - 1].length if prefix else 0
+        new_tokens = []
 
-        while self.current_char is not None and self.current_char in DIGITS + '.':
-            if self.current_char == '.':
-                if has_dot:
+        for token in self.scan(position):
+            if token.position >= end:
+                # Resynchronized: from a previous token start, lexing gives the same tokens
+                while suffix < count and tokens[suffix].position + delta < token.position:
+                    suffix += 1
+                if suffix < count and tokens[suffix].position + delta == token.position:
                     break
-                has_dot = True
-            num_str += self.current_char
-            self.advance()
 
-        if has_dot == 0:
-            return Token(TT_INT, position, int(num_str), length=len(num_str))
+            new_tokens.append(token)
+        else:
+            suffix = count
+
+        for index in range(suffix, count):
+            tokens[index].position += delta
 
-        return Token(TT_FLOAT, position, float(num_str), length=len(num_str))
+        result = tokens[:prefix] + new_tokens + tokens[suffix:count]
+        result.append(Token(TT_EOF, len(self.sentence)))
 
-    def make_var(self):
-        """Create number token (VAR)"""
+        return result, prefix, prefix + len(new_tokens)
 
-        var_name = ''
-        position = self.index
+def _bisect_tokens(tokens: List[Token], count: int, position: int, \
+                   key: Callable[[Token], int]) -> int:
+    """Count the first tokens with key before position, the keys are sorted"""
 
-        while self.current_char is not None and self.current_char.lower() in ALPHABET + DIGITS:
-            var_name += self.current_char
-            self.advance()
+    low, high = 0, count
+
+    while low < high:
+        middle = (low + high) // 2
 
-        return Token(TT_VAR, position, var_name, length=len(var_name))
+        if key(tokens[middle]) < position:
+            low = middle + 1
+        else:
+            high = middle
+
+    return low
 
 class GenericNode:
     """Generic node of AST"""
 
+    __slots__ = ()
+
+    def children(self) -> Tuple['GenericNode', ...]:
+        """Get the child nodes"""
+        return ()
+
+def iter_nodes(node: GenericNode) -> Generator[GenericNode, None, None]:
+    """Iterate over all nodes of the tree, without recursion. Shared nodes are given once"""
+
+    stack = [node]
+    seen = {node}
+
+    while stack:
+        node = stack.pop()
+        yield node
+
+        for child in node.children():
+            if child not in seen:
+                seen.add(child)
+                stack.append(child)
+
+def span_token(node: GenericNode) -> Token:
+    """Get a token from the first to the last char of the tokens of the tree of node"""
+
+    tokens = [getattr(child, attribute) for child in iter_nodes(node) \
+              for attribute in ('token', 'operator', 'name') if hasattr(child, attribute)]
+
+    start = min(token.position for token in tokens)
+    end = max(token.position + token.length for token in tokens)
+    return Token(tokens[0].type, start, length=end - start)
+
+def is_deeper(node: GenericNode, depth: int) -> bool:
+    """Check if the tree has more than depth levels below node, without recursion"""
+
+    level = {node}
+
+    for _ in range(depth):
+        level = {child for parent in level for child in parent.children()}
+        if not level:
+            return False
+
+    return True
+
+def shared_nodes(node: GenericNode) -> Set[GenericNode]:
+    """
+    Get the nodes with more than one parent in an optimized AST, that are worth
+    evaluating once. Numbers and variables are cheap, or cached by the interpreter
+    """
+
+    children: Set[GenericNode] = set()
+    shared: Set[GenericNode] = set()
+
+    for parent in iter_nodes(node):
+        for child in parent.children():
+            if child in children and child.children():
+                shared.add(child)
+            children.add(child)
+
+    return shared
+
 class NumberNode(GenericNode):
     """Numeric node of AST"""
 
+    __slots__ = ('token',)
+
     def __init__(self, token: Token) -> None:
         self.token = token
 
@@ -249,6 +458,8 @@ class NumberNode(GenericNode):
 class VariableNode(GenericNode):
     """Variable node of AST"""
 
+    __slots__ = ('token',)
+
     def __init__(self, token: Token) -> None:
         self.token = token
 
@@ -258,52 +469,106 @@ class VariableNode(GenericNode):
 class BinaryOperatorNode(GenericNode):
     """Binary operator node of AST"""
 
+    __slots__ = ('left_node', 'operator', 'right_node')
+
     def __init__(self, left_node: GenericNode, operator: Token, right_node: GenericNode) -> None:
         self.left_node = left_node
         self.operator = operator
         self.right_node = right_node
 
+    def children(self) -> Tuple[GenericNode, ...]:
+        """Get the child nodes"""
+        return (self.left_node, self.right_node)
+
     def __str__(self) -> str:
         return f"[{self.left_node},{self.operator},{self.right_node}]"
 
 class UnaryOperatorNode(GenericNode):
     """Unary operator node of AST"""
 
+    __slots__ = ('operator', 'node')
+
     def __init__(self, operator: Token, node: GenericNode) -> None:
         self.operator = operator
         self.node = node
 
+    def children(self) -> Tuple[GenericNode, ...]:
+        """Get the child nodes"""
+        return (self.node,)
+
     def __str__(self) -> str:
         return f"[{self.operator},{self.node}]"
 
 class DotNode(GenericNode):
     """Dot node of AST"""
 
+    __slots__ = ('dot_x', 'dot_y')
+
     def __init__(self, dot_x: GenericNode, dot_y: GenericNode) -> None:
         self.dot_x = dot_x
         self.dot_y = dot_y
 
+    def children(self) -> Tuple[GenericNode, ...]:
+        """Get the child nodes"""
+        return (self.dot_x, self.dot_y)
+
     def __str__(self) -> str:
         return f"[{self.dot_x},{self.dot_y}]"
 
 class DefineNode(GenericNode):
     """Define node of AST"""
 
+    __slots__ = ('name', 'value')
+
     def __init__(self, name: Token, value: GenericNode) -> None:
         self.name = name
         self.value = value
 
+    def children(self) -> Tuple[GenericNode, ...]:
+        """Get the child nodes"""
+        return (self.value,)
+
     def __str__(self) -> str:
         return f"[{self.name}: {self.value}]"
 
+class RelationNode(GenericNode):
+    """Relation node of AST, like an equation"""
+
+    __slots__ = ('left_node', 'operator', 'right_node')
+
+    def __init__(self, left_node: GenericNode, operator: Token, right_node: GenericNode) -> None:
+        self.left_node = left_node
+        self.operator = operator
+        self.right_node = right_node
+
+    def children(self) -> Tuple[GenericNode, ...]:
+        """Get the child nodes"""
+        return (self.left_node, self.right_node)
+
+    def __str__(self) -> str:
+        return f"[{self.left_node},{self.operator},{self.right_node}]"
+
+# Parsed parenthesized groups by their LPAREN token:
+# (node, count of tokens, RPAREN token, groups inside it)
+Groups = Dict[Token, Tuple[GenericNode, int, Token, Dict]]
+
 class Parser:
     """Create AST to parser the math sentences"""
-    def __init__(self, tokens: Iterator[Token]) -> None:
+    def __init__(self, tokens: Iterator[Token], groups: Union[Groups, None]=None, \
+                 stale: Union[Tuple[int, int], None]=None) -> None:
         self.tokens = list(tokens)
         self.index = -1
         self.current_token = None
         self.advance()
 
+        # The groups of a previous parse, valid if their tokens aren't in the stale range
+        self.reuse: Groups = groups or {}
+        self.stale = stale
+        self.groups: Groups = {}
+
+        # Group parsed by sentence before knowing it isn't a dot, the next operand
+        self.operand: Union[GenericNode, None] = None
+
     def advance(self):
         """Advance the index and update the current_token"""
 
@@ -336,30 +601,18 @@ class Parser:
         """
         Try to parse the tokens of sentence
         formats:
-            (VAR)(DEF)[expr]  
             (LPAREN) [expr] (SEP) [expr] (RPAREN)  
-            (LPAREN) [expr] (RPAREN)  
-            [expr]
+            [relation]
         """
 
         if self.current_token is not None:
             if self.current_token.type == TT_LPAREN:
-                self.advance()
-                res = self.expr()
-
-                if self.current_token.type == TT_SEP:
-                    x_dot = res
-                    self.advance()
-                    y_dot = self.expr()
-
-                    res = DotNode(x_dot, y_dot)
+                res = self.leading_group()
 
-                if self.current_token.type != TT_RPAREN:
-                    raise InvalidSyntaxError("Expected ')'", token=self.current_token)
-
-                self.advance()
+                if res is None:
+                    res = self.relation()
             else:
-                res = self.expr()
+                res = self.relation()
         else:
             res = self.expr()
 
@@ -368,6 +621,57 @@ class Parser:
 
         return res
 
+    def leading_group(self) -> Union[GenericNode, None]:
+        """
+        Try to parse the LPAREN that starts the sentence, format:
+            (LPAREN) [expr] (SEP) [expr] (RPAREN)  
+            (LPAREN) [expr] (RPAREN)
+        Return the dot, or None with the group kept as the first operand of the relation
+        """
+
+        self.operand = self.reused_group()
+        if self.operand is not None:
+            return None
+
+        start_token, start = self.current_token, self.index
+        registered = len(self.groups)
+
+        self.advance()
+        res = self.expr()
+
+        if self.current_token.type == TT_SEP:
+            self.advance()
+            res = DotNode(res, self.expr())
+
+        if self.current_token.type != TT_RPAREN:
+            raise InvalidSyntaxError("Expected ')'", token=self.current_token)
+
+        self.advance()
+
+        if isinstance(res, DotNode):
+            return res
+
+        # The groups inside it were registered at the top level, while it was a dot or not
+        inner = dict(itertools.islice(self.groups.items(), registered, None))
+        self.groups[start_token] = (res, self.index - start, self.tokens[self.index - 1], inner)
+
+        self.operand = res
+        return None
+
+    def relation(self) -> GenericNode:
+        """Try to parse a relation in tokens, format:
+        [expr] ((EQ|LT|GT|LTE|GTE) [expr])?
+        """
+
+        current = self.expr()
+        operator = self.current_token
+
+        if operator is not None and operator.type in RELATION_OPERATORS:
+            self.advance()
+            current = RelationNode(current, operator, self.expr())
+
+        return current
+
     def expr(self) -> GenericNode:
         """Try to parse an expr in tokens, format:
         [factor] ((PLUS|MINUS) [factor])*
@@ -421,6 +725,10 @@ class Parser:
             (VAR)
         """
 
+        if self.operand is not None:
+            operand, self.operand = self.operand, None
+            return operand
+
         if self.current_token is None or self.current_token.type == TT_EOF:
             raise InvalidSyntaxError("Unexpected factor", token=None)
 
@@ -430,17 +738,7 @@ class Parser:
             return UnaryOperatorNode(operator, self.factor())
 
         if self.current_token.type == TT_LPAREN:
-            self.advance()
-            expr = self.expr()
-
-            if self.current_token.type != TT_RPAREN:
-                raise InvalidSyntaxError("Expected ')'", token=self.current_token)
-
-            if expr is None:
-                raise InvalidSyntaxError("Unexpected ')'", token=self.current_token)
-
-            self.advance()
-            return expr
+            return self.group()
 
         if self.current_token.type in (TT_FLOAT, TT_INT):
             number = NumberNode(self.current_token)
@@ -454,68 +752,663 @@ class Parser:
 
         raise InvalidSyntaxError("Unexpected factor", token=self.current_token)
 
+    def group(self) -> GenericNode:
+        """Try to parse a parenthesized group, reusing it if it's unchanged, format:
+            (LPAREN) [expr] (RPAREN)
+        """
+
+        expr = self.reused_group()
+        if expr is not None:
+            return expr
+
+        frame = self.open_group()
+        return self.close_group(frame, self.expr())
+
+    def reused_group(self) -> Union[GenericNode, None]:
+        """Skip the group starting in the current LPAREN if it's unchanged, returning its node"""
+
+        start_token, start = self.current_token, self.index
+        cached = self.reuse.get(start_token)
+
+        if cached is not None:
+            expr, count, end_token = cached[:3]
+            end = start + count - 1
+
+            if end < len(self.tokens) and self.tokens[end] is end_token and \
+                (self.stale is None or end < self.stale[0] or start >= self.stale[1]):
+                self.groups[start_token] = cached
+                self.index = end
+                self.advance()
+                return expr
+
+        return None
+
+    def open_group(self) -> Tuple[Token, int, Groups, Groups]:
+        """Enter the group starting in the current LPAREN, returning what close_group needs"""
+
+        start_token, start = self.current_token, self.index
+        cached = self.reuse.get(start_token)
+
+        frame = (start_token, start, self.reuse, self.groups)
+        self.reuse, self.groups = cached[3] if cached is not None else {}, {}
+
+        self.advance()
+        return frame
+
+    def close_group(self, frame: Tuple[Token, int, Groups, Groups], expr: GenericNode \
+                    ) -> GenericNode:
+        """Check the RPAREN of the group with expr inside it, and register the group"""
+
+        start_token, start, reuse, groups = frame
+
+        if self.current_token.type != TT_RPAREN:
+            raise InvalidSyntaxError("Expected ')'", token=self.current_token)
+
+        if expr is None:
+            raise InvalidSyntaxError("Unexpected ')'", token=self.current_token)
+
+        self.advance()
+
+        groups[start_token] = (expr, self.index - start, self.tokens[self.index - 1], self.groups)
+        self.reuse, self.groups = reuse, groups
+
+        return expr
+
+# Left and right binding powers of the binary operators, ^ is right associative
+BINDING_POWERS = {
+    TT_PLUS: (1, 2),
+    TT_MINUS: (1, 2),
+    TT_MUL: (3, 4),
+    TT_DIV: (3, 4),
+    TT_POWER: (6, 5)
+}
+
+# Right binding power of the unary operators, their operand is a factor, with its ^
+UNARY_BINDING_POWER = 5
+
+# Kinds of the pending frames of PrattParser
+FRAME_UNARY, FRAME_BINARY, FRAME_GROUP = range(3)
+
+class PrattParser(Parser):
+    """
+    Parse the expressions by operator precedence, with an explicit stack instead of
+    recursion, so there isn't a limit of nesting. The AST and the errors are the same of
+    Parser, it's linear in the number of tokens
+    """
+
+    def expr(self) -> GenericNode:
+        """Try to parse an expr in tokens, with the grammar of Parser.expr"""
+
+        stack: List[tuple] = []
+        min_power = 0
+
+        while True:
+            token = self.current_token
+
+            if self.operand is not None:
+                node, self.operand = self.operand, None
+
+            elif token is None or token.type == TT_EOF:
+                raise InvalidSyntaxError("Unexpected factor", token=None)
+
+            elif token.type in (TT_PLUS, TT_MINUS):
+                stack.append((FRAME_UNARY, token, min_power))
+                min_power = UNARY_BINDING_POWER
+                self.advance()
+                continue
+
+            elif token.type == TT_LPAREN:
+                node = self.reused_group()
+
+                if node is None:
+                    stack.append((FRAME_GROUP, self.open_group(), min_power))
+                    min_power = 0
+                    continue
+
+            elif token.type in (TT_FLOAT, TT_INT):
+                node = NumberNode(token)
+                self.advance()
+
+            elif token.type == TT_VAR:
+                node = VariableNode(token)
+                self.advance()
+
+            else:
+                raise InvalidSyntaxError("Unexpected factor", token=token)
+
+            # Reduce the pending frames until an operator binds node as its left operand
+            while True:
+                operator = self.current_token
+                powers = BINDING_POWERS.get(operator.type) if operator is not None else None
+
+                if powers is not None and powers[0] >= min_power:
+                    stack.append((FRAME_BINARY, (node, operator), min_power))
+                    min_power = powers[1]
+                    self.advance()
+                    break
+
+                if not stack:
+                    return node
+
+                kind, data, min_power = stack.pop()
+
+                if kind == FRAME_UNARY:
+                    node = UnaryOperatorNode(data, node)
+                elif kind == FRAME_BINARY:
+                    node = BinaryOperatorNode(data[0], data[1], node)
+                else:
+                    node = self.close_group(data, node)
+
+class IncrementalParser:
+    """
+    Parse the successive versions of an edited sentence. Only the chars around the
+    edits are lexed again, and the parenthesized groups without edits aren't parsed again,
+    nor optimized again by an IncrementalOptimizer given its groups. The reuse is by
+    group: the tokens outside them, like a flat chain of operations without parentheses,
+    are parsed again in each version, so an edit in a long flat line costs a parse of
+    the line without its groups
+    """
+
+    def __init__(self) -> None:
+        self.tokens: Union[List[Token], None] = None
+        self.groups: Groups = {}
+
+        # Chars changed since the last lex, (start, end, delta) with end in the new sentence
+        self.damage: Union[Tuple[int, int, int], None] = None
+        # Range of tokens changed since the groups were parsed
+        self.stale: Union[Tuple[int, int], None] = None
+
+    def reset(self):
+        """Forget the previous sentence, so the next one is parsed from scratch"""
+
+        self.tokens = None
+        self.groups = {}
+        self.damage = None
+        self.stale = None
+
+    def edit(self, start: int, end: int, length: int):
+        """Register that the chars from start to end were replaced by length chars"""
+
+        delta = length - (end - start)
+
+        if self.damage is None:
+            self.damage = (start, start + length, delta)
+            return
+
+        damage_start, damage_end, damage_delta = self.damage
+
+        if damage_end >= end:
+            damage_end += delta
+        elif damage_end > start:
+            damage_end = start + length
+
+        self.damage = (min(damage_start, start), max(damage_end, start + length), \
+                       damage_delta + delta)
+
+    def parse(self, sentence: str) -> GenericNode:
+        """Parse sentence, the previous sentence with the registered edits"""
+
+        lexer = Lexer(sentence)
+
+        if self.tokens is None:
+            self.tokens = list(lexer.make_tokens())
+            self.groups, self.stale, self.damage = {}, None, None
+
+        elif self.damage is not None:
+            old_count = len(self.tokens)
+            self.tokens, first, last = lexer.relex(self.tokens, *self.damage)
+            self.damage = None
+
+            if self.stale is None:
+                self.stale = (first, last)
+            else:
+                # Move the previous stale range to the new tokens and join both
+                shift = len(self.tokens) - old_count
+                stale_start, stale_end = self.stale
+
+                if stale_start >= last - shift:
+                    stale_start += shift
+                if stale_end >= last - shift:
+                    stale_end += shift
+
+                self.stale = (min(stale_start, first), max(stale_end, last))
+
+        parsed = PrattParser(self.tokens, self.groups, self.stale)
+        ast = parsed.parse_sentence()
+
+        self.groups, self.stale = parsed.groups, None
+        return ast
+
+# Opcodes of FlatExpression
+OP_NUMBER, OP_VARIABLE, OP_ARGUMENT, OP_NEGATE, OP_ADD, OP_SUB, OP_MUL, OP_DIV, OP_POWER, \
+    OP_STORE, OP_LOAD = range(11)
+
+BINARY_OPCODES = {
+    TT_PLUS: OP_ADD,
+    TT_MINUS: OP_SUB,
+    TT_MUL: OP_MUL,
+    TT_DIV: OP_DIV,
+    TT_POWER: OP_POWER
+}
+
+OPCODES_OPERATIONS = {opcode: BINARY_OPERATORS[type_] for type_, opcode in BINARY_OPCODES.items()}
+
+class FlatExpression:
+    """
+    Numeric AST encoded in postfix order: an array of opcodes and an array of operands,
+    indexes of constants (the numbers, and the tokens of variables and operators). It's
+    evaluated by a stack machine, without following pointers between nodes or recursion.
+    A shared node is evaluated once, its value is stored in a slot and loaded again
+    """
+
+    __slots__ = ('opcodes', 'operands', 'constants', 'slots')
+
+    def __init__(self, opcodes: array, operands: array, constants: List[Any], \
+                 slots: int=0) -> None:
+        self.opcodes = opcodes
+        self.operands = operands
+        self.constants = constants
+        self.slots = slots
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    @classmethod
+    def from_node(cls, node: GenericNode) -> 'FlatExpression':
+        """Encode the numeric AST of node"""
+
+        opcodes, operands, constants = array('B'), array('l'), []
+        shared = shared_nodes(node)
+        slots: Dict[GenericNode, int] = {}
+        stack = [(node, False)]
+
+        while stack:
+            node, visited = stack.pop()
+
+            if node in slots:
+                opcodes.append(OP_LOAD)
+                operands.append(slots[node])
+                continue
+
+            if isinstance(node, BinaryOperatorNode):
+                if node.operator.type not in BINARY_OPCODES:
+                    raise InternalInterpreterError("Unexpected node operator type")
+
+                if not visited:
+                    stack.extend(((node, True), (node.right_node, False), (node.left_node, False)))
+                    continue
+
+                opcode, constant = BINARY_OPCODES[node.operator.type], node.operator
+
+            elif isinstance(node, UnaryOperatorNode):
+                if node.operator.type == TT_PLUS:
+                    stack.append((node.node, False))
+                    continue
+                if node.operator.type != TT_MINUS:
+                    raise InternalInterpreterError("Unexpected node operator type")
+
+                if not visited:
+                    stack.extend(((node, True), (node.node, False)))
+                    continue
+
+                opcode, constant = OP_NEGATE, node.operator
+
+            elif isinstance(node, NumberNode):
+                opcode, constant = OP_NUMBER, node.token.value
+
+            elif isinstance(node, VariableNode):
+                if node.token.value in Interpreter.RESERVED_VARIABLE_NAMES:
+                    opcode = OP_ARGUMENT
+                else:
+                    opcode = OP_VARIABLE
+                constant = node.token
+
+            else:
+                raise InternalInterpreterError("Unexpected node type")
+
+            opcodes.append(opcode)
+            operands.append(len(constants))
+            constants.append(constant)
+
+            if node in shared:
+                opcodes.append(OP_STORE)
+                operands.append(len(slots))
+                slots[node] = len(slots)
+
+        return cls(opcodes, operands, constants, len(slots))
+
+    def evaluate(self, interpreter: 'Interpreter'):
+        """Evaluate the expression with the variables and arguments of interpreter"""
+
+        constants = self.constants
+        operations = OPCODES_OPERATIONS
+        stack: List[Any] = []
+        slots: List[Any] = [None] * self.slots
+
+        for opcode, operand in zip(self.opcodes, self.operands):
+            if opcode == OP_NUMBER:
+                stack.append(constants[operand])
+            elif opcode == OP_VARIABLE:
+                stack.append(interpreter.get_variable(constants[operand]))
+            elif opcode == OP_ARGUMENT:
+                stack.append(interpreter.get_argument(constants[operand]))
+            elif opcode == OP_NEGATE:
+                stack[-1] = -stack[-1]
+            elif opcode == OP_LOAD:
+                stack.append(slots[operand])
+            elif opcode == OP_STORE:
+                slots[operand] = stack[-1]
+            else:
+                right = stack.pop()
+
+                try:
+                    stack[-1] = operations[opcode](stack[-1], right)
+                except OverflowError as error:
+                    raise EvaluationBudgetError('Result too large', constants[operand]) from error
+
+        return stack[-1]
+
+# Kinds of nodes of PackedAST
+NODE_NUMBER, NODE_VARIABLE, NODE_BINARY, NODE_UNARY, NODE_DOT, NODE_DEFINE, \
+    NODE_RELATION = range(7)
+
+NODES_KINDS = {
+    NumberNode: NODE_NUMBER,
+    VariableNode: NODE_VARIABLE,
+    BinaryOperatorNode: NODE_BINARY,
+    UnaryOperatorNode: NODE_UNARY,
+    DotNode: NODE_DOT,
+    DefineNode: NODE_DEFINE,
+    RelationNode: NODE_RELATION
+}
+
+TOKENS_TYPES_VALUES = {int(type_): type_ for type_ in TokenType}
+
+class PackedAST:
+    """
+    ASTs encoded in postorder in arrays, compact to pickle and send to other processes.
+    Each node is its kind, its token and the indexes of its children, the nodes before
+    it, so the shared nodes of an optimized AST are still shared. Many ASTs are packed
+    together, each one is given by the index of its root
+    """
+
+    __slots__ = ('kinds', 'types', 'values', 'positions', 'lengths', 'children')
+
+    def __init__(self) -> None:
+        self.kinds = array('B')
+        self.types = array('B')
+        self.values: List[Any] = []
+        self.positions = array('l')
+        self.lengths = array('l')
+        self.children = array('l')
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def pack(self, node: GenericNode) -> int:
+        """Encode the AST of node, returning the index of its root"""
+
+        indexes: Dict[GenericNode, int] = {}
+        stack = [(node, False)]
+
+        while stack:
+            node, visited = stack.pop()
+
+            if node in indexes:
+                continue
+
+            children = node.children()
+
+            if not visited and children:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(children))
+                continue
+
+            if type(node) not in NODES_KINDS:
+                raise InternalInterpreterError("Unexpected node type")
+
+            kind = NODES_KINDS[type(node)]
+
+            if kind in (NODE_NUMBER, NODE_VARIABLE):
+                token = node.token
+            elif kind == NODE_DEFINE:
+                token = node.name
+            elif kind != NODE_DOT:
+                token = node.operator
+            else:
+                token = None
+
+            self.kinds.append(kind)
+            if token is None:
+                self.types.append(0)
+                self.values.append(None)
+                self.positions.append(0)
+                self.lengths.append(0)
+            else:
+                self.types.append(token.type)
+                self.values.append(token.value)
+                self.positions.append(token.position)
+                self.lengths.append(token.length)
+
+            self.children.extend(indexes[child] for child in children)
+            indexes[node] = len(self.kinds) - 1
+
+        return indexes[node]
+
+    def unpack(self) -> List[GenericNode]:
+        """Decode all nodes, by their indexes. They are created from the first one"""
+
+        nodes: List[GenericNode] = []
+        children = iter(self.children)
+
+        for kind, type_, value, position, length in zip(self.kinds, self.types, self.values, \
+                                                        self.positions, self.lengths):
+            if kind == NODE_DOT:
+                node: GenericNode = DotNode(nodes[next(children)], nodes[next(children)])
+                nodes.append(node)
+                continue
+
+            token = Token(TOKENS_TYPES_VALUES[type_], position, value, length=length)
+
+            if kind == NODE_NUMBER:
+                node = NumberNode(token)
+            elif kind == NODE_VARIABLE:
+                node = VariableNode(token)
+            elif kind == NODE_UNARY:
+                node = UnaryOperatorNode(token, nodes[next(children)])
+            elif kind == NODE_DEFINE:
+                node = DefineNode(token, nodes[next(children)])
+            elif kind == NODE_BINARY:
+                node = BinaryOperatorNode(nodes[next(children)], token, nodes[next(children)])
+            else:
+                node = RelationNode(nodes[next(children)], token, nodes[next(children)])
+
+            nodes.append(node)
+
+        return nodes
+
 class GenericValue:
     """Generic value to handle values"""
 
+    @property
+    def variables(self) -> FrozenSet[str]:
+        """Names of the variables used by the value"""
+        return frozenset()
+
+    @property
+    def size(self) -> int:
+        """Nodes visited by an evaluation of the value"""
+        return 0
+
+    def span(self) -> Token:
+        """Get a token from the first to the last char of the value in its sentence"""
+        raise NotImplementedError
+
 class NumericValue(GenericValue):
     """Create a numeric value"""
 
+    # Deeper ASTs are evaluated flat, the nested closures would reach the recursion limit
+    MAX_COMPILED_DEPTH = 100
+
     def __init__(self, value: GenericNode) -> None:
         self.value = value
+        self.compiled: Union[Callable[['Interpreter'], Any], None] = None
+        self.flat: Union[FlatExpression, None] = None
+        self._variables: Union[FrozenSet[str], None] = None
+        self._size: Union[int, None] = None
+
+    @property
+    def variables(self) -> FrozenSet[str]:
+        """Names of the variables used by the value"""
+
+        if self._variables is None:
+            self._variables = frozenset(
+                node.token.value for node in iter_nodes(self.value) \
+                if isinstance(node, VariableNode)
+            )
+        return self._variables
+
+    @property
+    def size(self) -> int:
+        """Nodes visited by an evaluation of the value, the shared nodes are visited once"""
+
+        if self._size is None:
+            self._size = sum(1 for _ in iter_nodes(self.value))
+        return self._size
+
+    def span(self) -> Token:
+        """Get a token from the first to the last char of the value in its sentence"""
+        return span_token(self.value)
+
+    def compile(self, flat: bool=False) -> Callable[['Interpreter'], Any]:
+        """
+        Compile the AST in a callable, so the tree isn't walked in each evaluation.
+        If flat, or the AST is too deep for nested closures, the callable evaluates
+        the flat encoding of the AST
+        """
+
+        if self.compiled is None:
+            if flat or is_deeper(self.value, self.MAX_COMPILED_DEPTH):
+                self.compiled = self.flatten().evaluate
+            else:
+                shared = shared_nodes(self.value)
+                closures: Dict[GenericNode, Callable[['Interpreter'], Any]] = {}
+                self.compiled = self._compile(self.value, shared, closures)
+
+                # A closure by node, so the size is known without walking the tree again
+                self._size = len(closures)
+
+                if shared:
+                    self.compiled = _with_frame(self.compiled)
+        return self.compiled
+
+    def flatten(self) -> FlatExpression:
+        """Get the flat encoding of the AST"""
+
+        if self.flat is None:
+            self.flat = FlatExpression.from_node(self.value)
+        return self.flat
 
     def get_value(self, interpreter: 'Interpreter'):
         """Get the value of dot"""
-        return self._visit(self.value, interpreter)
 
-    def _visit(self, node: GenericNode, interpreter: 'Interpreter'):
-        if isinstance(node, NumberNode):
-            return node.token.value
+        if self.compiled is None:
+            self.compile()
+        return self.compiled(interpreter)
 
-        if isinstance(node, VariableNode):
-            if node.token.value not in interpreter.vars:
-                raise UndefinedVariableError(node.token)
+    def _compile(self, node: GenericNode, shared: Set[GenericNode], \
+                 closures: Dict[GenericNode, Callable[['Interpreter'], Any]] \
+                 ) -> Callable[['Interpreter'], Any]:
+        if node in closures:
+            return closures[node]
+
+        closure = self._compile_node(node, shared, closures)
 
-            value = interpreter.vars[node.token.value]
+        if node in shared:
+            closure = _memoized(node, closure)
 
-            if not isinstance(value, NumericValue):
-                raise UnexpectedVariableTypeError('NumericValue', node.token)
+        closures[node] = closure
+        return closure
 
-            return value.get_value(interpreter)
+    def _compile_node(self, node: GenericNode, shared: Set[GenericNode], \
+                      closures: Dict[GenericNode, Callable[['Interpreter'], Any]] \
+                      ) -> Callable[['Interpreter'], Any]:
+        if isinstance(node, NumberNode):
+            number = node.token.value
+            return lambda interpreter: number
+
+        if isinstance(node, VariableNode):
+            token = node.token
+
+            if token.value in Interpreter.RESERVED_VARIABLE_NAMES:
+                return lambda interpreter: interpreter.get_argument(token)
+            return lambda interpreter: interpreter.get_variable(token)
 
         if isinstance(node, BinaryOperatorNode):
-            left_value = self._visit(node.left_node, interpreter)
-            right_value = self._visit(node.right_node, interpreter)
-
-            if node.operator.type == TT_PLUS:
-                value = left_value + right_value
-            elif node.operator.type == TT_MINUS:
-                value = left_value - right_value
-            elif node.operator.type == TT_MUL:
-                value = left_value * right_value
-            elif node.operator.type == TT_DIV:
-                value = left_value / right_value
-            elif node.operator.type == TT_POWER:
-                value = left_value ** right_value
-            else:
+            if node.operator.type not in BINARY_OPERATORS:
                 raise InternalInterpreterError("Unexpected node operator type")
 
-            return value
+            operation, operator = BINARY_OPERATORS[node.operator.type], node.operator
+            left = self._compile(node.left_node, shared, closures)
+            right = self._compile(node.right_node, shared, closures)
+
+            def binary(interpreter: 'Interpreter'):
+                try:
+                    return operation(left(interpreter), right(interpreter))
+                except OverflowError as error:
+                    raise EvaluationBudgetError('Result too large', operator) from error
+
+            return binary
 
         if isinstance(node, UnaryOperatorNode):
-            value = self._visit(node.node, interpreter)
+            operand = self._compile(node.node, shared, closures)
 
             if node.operator.type == TT_MINUS:
-                value *= -1
-            elif node.operator.type != TT_PLUS:
+                return lambda interpreter: -operand(interpreter)
+            if node.operator.type != TT_PLUS:
                 raise InternalInterpreterError("Unexpected node operator type")
 
-            return value
+            return operand
 
         raise InternalInterpreterError("Unexpected node type")
 
     def __str__(self) -> str:
         return f"<{self.value}>"
 
+def _reference_error(error: Exception, token: Token) -> Exception:
+    """Get the error to raise where the variable of token is used, if it failed with error"""
+
+    if isinstance(error, EvaluationBudgetError):
+        return EvaluationBudgetError(f'Variable "{token.value}" over budget', token)
+    return error
+
+def _memoized(node: GenericNode, function: Callable[['Interpreter'], Any]):
+    """Evaluate function of a shared node once in each evaluation frame"""
+
+    def memoized(interpreter: 'Interpreter'):
+        frame = interpreter.frame
+
+        if node in frame:
+            return frame[node]
+
+        result = frame[node] = function(interpreter)
+        return result
+
+    return memoized
+
+def _with_frame(function: Callable[['Interpreter'], Any]):
+    """Evaluate function in a new evaluation frame, for the values of its shared nodes"""
+
+    def with_frame(interpreter: 'Interpreter'):
+        previous_frame = interpreter.frame
+        interpreter.frame = {}
+        try:
+            return function(interpreter)
+        finally:
+            interpreter.frame = previous_frame
+
+    return with_frame
+
 class DotValue(GenericValue):
     """Crate a dot"""
 
@@ -523,6 +1416,26 @@ class DotValue(GenericValue):
         self.dot_x = dot_x
         self.dot_y = dot_y
 
+    @property
+    def variables(self) -> FrozenSet[str]:
+        """Names of the variables used by the value"""
+        return self.dot_x.variables | self.dot_y.variables
+
+    @property
+    def size(self) -> int:
+        """Nodes visited by an evaluation of the value"""
+        return self.dot_x.size + self.dot_y.size
+
+    def span(self) -> Token:
+        """Get a token from the first to the last char of the dot in its sentence"""
+        return span_token(DotNode(self.dot_x.value, self.dot_y.value))
+
+    def compile(self, flat: bool=False) -> None:
+        """Compile the coordinates of dot"""
+
+        self.dot_x.compile(flat)
+        self.dot_y.compile(flat)
+
     def get_value(self, interpreter: 'Interpreter') -> Tuple[Union[int,float], Union[int,float]]:
         """Get the value of dot"""
 
@@ -531,42 +1444,384 @@ class DotValue(GenericValue):
     def __str__(self) -> str:
         return f"({self.dot_x!s}, {self.dot_y!s})"
 
+class CurveValue(GenericValue):
+    """Create a curve, the graph of y = f(x)"""
+
+    def __init__(self, function: NumericValue) -> None:
+        self.function = function
+
+    @property
+    def variables(self) -> FrozenSet[str]:
+        """Names of the variables used by the value"""
+        return self.function.variables
+
+    @property
+    def size(self) -> int:
+        """Nodes visited by an evaluation of the value in each point"""
+        return self.function.size
+
+    def span(self) -> Token:
+        """Get a token from the first to the last char of the value in its sentence"""
+        return self.function.span()
+
+    def compile(self, flat: bool=False) -> None:
+        """Compile the function of curve"""
+
+        self.function.compile(flat)
+
+    def get_values(self, interpreter: 'Interpreter', x_values):
+        """Get the y values of the curve, evaluated in a single pass over all x_values"""
+
+        return interpreter.evaluate(self.function, x=x_values)
+
+    def __str__(self) -> str:
+        return f"y = {self.function!s}"
+
+class ImplicitValue(GenericValue):
+    """Create an implicit curve, the points where f(x, y) = 0"""
+
+    def __init__(self, function: NumericValue) -> None:
+        self.function = function
+
+    @property
+    def variables(self) -> FrozenSet[str]:
+        """Names of the variables used by the value"""
+        return self.function.variables
+
+    @property
+    def size(self) -> int:
+        """Nodes visited by an evaluation of the value in each point"""
+        return self.function.size
+
+    def span(self) -> Token:
+        """Get a token from the first to the last char of the value in its sentence"""
+        return self.function.span()
+
+    def compile(self, flat: bool=False) -> None:
+        """Compile the function of implicit curve"""
+
+        self.function.compile(flat)
+
+    def get_values(self, interpreter: 'Interpreter', x_values, y_values):
+        """Get the values of f, evaluated in a single pass over all x_values and y_values"""
+
+        return interpreter.evaluate(self.function, x=x_values, y=y_values)
+
+    def __str__(self) -> str:
+        return f"{self.function!s} = 0"
+
+class RegionValue(ImplicitValue):
+    """Create a region, the points where f(x, y) compared with zero is true"""
+
+    def __init__(self, function: NumericValue, comparison: TokenType) -> None:
+        super().__init__(function)
+        self.comparison = comparison
+
+    def contains(self, values):
+        """Check which values of the function are inside the region"""
+
+        return RELATION_OPERATORS[self.comparison](values, 0)
+
+    def __str__(self) -> str:
+        return f"{self.function!s} ({self.comparison}) 0"
+
 class Interpreter:
     """interpret AST to parser the math sentences"""
 
     NO_NAME_VARNAME = '__@no name@__'
     RESERVED_VARIABLE_NAMES = ('x', 'y')
 
-    def __init__(self) -> None:
+    # Node visits by point of the biggest evaluation, bigger ones would stall the worker
+    MAX_EVALUATION_COST = 500_000_000
+
+    # A node visit costs about as much as the visits of this many points of an array,
+    # so the nodes of a single point are bounded too
+    NODE_VISIT_POINTS = 1000
+
+    def __init__(self, flat: bool=False) -> None:
         self.vars: dict = {self.NO_NAME_VARNAME: []}
 
+        # Evaluate the values with their flat encoding
+        self.flat = flat
+
+        self.dependencies: Dict[str, FrozenSet[str]] = {}
+        self.dependents: Dict[str, Set[str]] = {}
+        self.cache: Dict[str, Any] = {}
+        self._evaluating: Set[str] = set()
+
+        self.arguments: Dict[str, Any] = {}
+        self._argument_reads = 0
+
+        # Values of the variables that use the arguments, while they are the same
+        self._argument_values: Dict[str, Any] = {}
+
+        # Errors of the dependencies evaluated before a variable, raised where they are used
+        self._failures: Dict[str, Exception] = {}
+
+        # Values of the shared nodes in the current evaluation
+        self.frame: Dict[GenericNode, Any] = {}
+
+        # Errors of the variables that went over the budget, by their value
+        self.errors: Dict[GenericValue, EvaluationBudgetError] = {}
+
     def visit(self, ast) -> GenericValue:
         """Parse the ast and returns values"""
 
+        variable_name, value = self.interpret(ast)
+
+        if variable_name is not None:
+            self.define(variable_name, value)
+
+        return value
+
+    def interpret(self, ast) -> Tuple[Union[str, None], GenericValue]:
+        """Create the value of the ast and the name it defines, without changing variables"""
+
         if isinstance(ast, DotNode):
-            return DotValue(NumericValue(ast.dot_x), NumericValue(ast.dot_y))
+            dot = DotValue(NumericValue(ast.dot_x), NumericValue(ast.dot_y))
+            dot.compile(self.flat)
+            self.check_budget(dot)
+            return None, dot
+
+        if isinstance(ast, RelationNode):
+            # left = right is drawn as left - right = 0
+            difference = BinaryOperatorNode(ast.left_node, Token(TT_MINUS, ast.operator.position), \
+                                            ast.right_node)
+            if ast.operator.type == TT_EQ:
+                implicit = ImplicitValue(NumericValue(difference))
+            else:
+                implicit = RegionValue(NumericValue(difference), ast.operator.type)
+            implicit.compile(self.flat)
+            self.check_budget(implicit)
+            return None, implicit
 
         if isinstance(ast, DefineNode):
             variable_name = str(ast.name.value)
+            value = self.interpret(ast.value)[1]
+
+            if variable_name == 'y' and isinstance(value, CurveValue):
+                return None, value
 
             if variable_name in self.RESERVED_VARIABLE_NAMES:
                 raise ReservedVariableNameError(variable_name, ast.name)
 
-            value = self.visit(ast.value)
-            self.vars[variable_name] = value
-            return value
+            if isinstance(value, CurveValue):
+                value = value.function
+
+            return variable_name, value
 
-        return NumericValue(ast)
+        value = NumericValue(ast)
+        value.compile(self.flat)
+        self.check_budget(value)
+        return None, CurveValue(value)
+
+    def check_budget(self, value: GenericValue, points: int=1) -> None:
+        """
+        Raise EvaluationBudgetError if evaluating value in points points at once would
+        cost too much. The values are checked in a single point when interpreted, and
+        in the points of each evaluation over the view
+        """
+
+        if value.size * (points + self.NODE_VISIT_POINTS) > self.MAX_EVALUATION_COST:
+            message = f'Expression too big, {value.size} nodes'
+            if points > 1:
+                message += f' in {points} points'
+
+            raise EvaluationBudgetError(message, value.span())
 
     def parse_ast(self, ast) -> None:
         """Parse the ast, but it doesn't return"""
 
-        value = self.visit(ast)
+        variable_name, value = self.interpret(ast)
 
-        if isinstance(ast, DotNode):
+        if variable_name is None:
             self.vars[self.NO_NAME_VARNAME].append(value)
+        else:
+            self.define(variable_name, value)
+
+    def define(self, name: str, value: GenericValue) -> None:
+        """Define a variable, updating the dependency graph"""
+
+        self.undefine(name)
+
+        self.vars[name] = value
+        self.dependencies[name] = value.variables
+        for dependency in value.variables:
+            self.dependents.setdefault(dependency, set()).add(name)
+
+    def undefine(self, name: str) -> None:
+        """Remove a variable, invalidating the values that depend on it"""
+
+        self.invalidate(name)
+        self.vars.pop(name, None)
+
+        for dependency in self.dependencies.pop(name, ()):
+            self.dependents[dependency].discard(name)
+
+    def invalidate(self, name: str) -> None:
+        """Remove the cached value of the variable and of everything downstream of it"""
+
+        stack = [name]
+        while stack:
+            name = stack.pop()
+
+            # A value is only cached after all its dependencies were cached
+            if name in self.cache:
+                del self.cache[name]
+                stack.extend(self.dependents.get(name, ()))
+
+    def get_variable(self, token: Token):
+        """
+        Get the value of a numeric variable, memoized until it is invalidated. The
+        dependencies that aren't evaluated are evaluated first, deepest first, so a
+        long chain of definitions doesn't nest a call by variable
+        """
+
+        name = token.value
+
+        if name in self.cache:
+            return self.cache[name]
+
+        if name in self._argument_values:
+            self._argument_reads += 1
+            return self._argument_values[name]
+
+        if name in self._failures:
+            raise _reference_error(self._failures[name], token)
+
+        if name not in self.vars:
+            raise UndefinedVariableError(token)
+
+        if not isinstance(self.vars[name], NumericValue):
+            raise UnexpectedVariableTypeError('NumericValue', token)
+
+        if name in self._evaluating:
+            raise CircularDefinitionError(token)
+
+        outermost = not self._evaluating
+        try:
+            for dependency in self._missing_dependencies(name):
+                try:
+                    self._evaluate_variable(dependency)
+                except Exception as error: # pylint: disable=broad-except
+                    # It's raised again where the dependency is used
+                    self._failures[dependency] = error
+
+            try:
+                return self._evaluate_variable(name)
+            except EvaluationBudgetError as error:
+                raise _reference_error(error, token) from error
+        finally:
+            if outermost:
+                self._failures.clear()
+
+    def _missing_dependencies(self, name: str) -> List[str]:
+        """
+        Get the numeric variables that name depends on and aren't evaluated, each one
+        after its own dependencies. A dependency in a cycle is left to the evaluation
+        """
+
+        def missing(dependency: str) -> bool:
+            return isinstance(self.vars.get(dependency), NumericValue) and \
+                dependency not in self.cache and dependency not in self._argument_values and \
+                dependency not in self._failures and dependency not in self._evaluating
+
+        order = []
+        visited = {name}
+        stack = [(name, iter(self.dependencies.get(name, ())))]
+
+        while stack:
+            current, dependencies = stack[-1]
+
+            for dependency in dependencies:
+                if dependency not in visited and missing(dependency):
+                    visited.add(dependency)
+                    stack.append((dependency, iter(self.dependencies.get(dependency, ()))))
+                    break
+            else:
+                stack.pop()
+                order.append(current)
+
+        # The last one is name
+        return order[:-1]
+
+    def _evaluate_variable(self, name: str):
+        """Evaluate the variable name, caching its value"""
+
+        value = self.vars[name]
+        argument_reads = self._argument_reads
+
+        self._evaluating.add(name)
+        try:
+            result = value.get_value(self)
+        except EvaluationBudgetError as error:
+            # The error is shown in the sentence of the variable, and where it's used
+            self.errors[value] = error
+            raise
+        finally:
+            self._evaluating.discard(name)
+
+        # Values that use x or y change with the arguments, they are kept while they don't
+        if argument_reads == self._argument_reads:
+            self.cache[name] = result
+        else:
+            self._argument_values[name] = result
+        return result
+
+    def get_argument(self, token: Token):
+        """Get the value of a reserved variable, given in evaluate"""
+
+        if token.value not in self.arguments:
+            raise UndefinedVariableError(token)
+
+        self._argument_reads += 1
+        return self.arguments[token.value]
+
+    def evaluate(self, value: NumericValue, **arguments):
+        """Get the value with the reserved variables defined by arguments"""
+
+        previous_arguments, previous_values = self.arguments, self._argument_values
+        self.arguments, self._argument_values = arguments, {}
+        try:
+            return value.get_value(self)
+        finally:
+            self.arguments, self._argument_values = previous_arguments, previous_values
 
     def clear(self) -> None:
         """Clear variables"""
 
         self.vars = {self.NO_NAME_VARNAME: []}
+        self.dependencies = {}
+        self.dependents = {}
+        self.cache = {}
+        self.errors = {}
+
+    def update(self, other: 'Interpreter') -> None:
+        """
+        Take the variables of other, a copy that isn't used after, keeping the cached values
+        of the variables whose value and the values of its dependencies are the same objects.
+        So a long-lived interpreter, like the one of a worker, keeps its cache between versions
+        """
+
+        # The dependents are the old ones, a new dependent of a variable is a changed variable
+        for name in self.vars.keys() | other.vars.keys():
+            if name != self.NO_NAME_VARNAME and self.vars.get(name) is not other.vars.get(name):
+                self.invalidate(name)
+
+        self.vars = other.vars
+        self.dependencies = other.dependencies
+        self.dependents = other.dependents
+
+    def copy(self) -> 'Interpreter':
+        """
+        Get an interpreter with the same variables, that can evaluate in another thread.
+        The values are shared, they only keep what is the same for any interpreter
+        """
+
+        interpreter = Interpreter(self.flat)
+        interpreter.vars = dict(self.vars)
+        interpreter.vars[self.NO_NAME_VARNAME] = list(self.vars[self.NO_NAME_VARNAME])
+        interpreter.dependencies = dict(self.dependencies)
+        interpreter.dependents = {name: set(names) for name, names in self.dependents.items()}
+        interpreter.cache = dict(self.cache)
+        return interpreter
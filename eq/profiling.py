@@ -0,0 +1,160 @@
+"""Named timers and counters of the hot paths, shown as an overlay and logged by frame"""
+
+import contextlib
+import csv
+import time
+from collections import deque
+from typing import Deque, Dict, List, Union
+import pygame
+
+# Shared by the timers of a disabled profiler, entering it does nothing
+_NULL_TIMER = contextlib.nullcontext()
+
+class _Timer:
+    """Add the time spent in the with block to the timer name of profiler"""
+
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler: 'Profiler', name: str) -> None:
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exception) -> None:
+        timers = self.profiler.timers
+        timers[self.name] = timers.get(self.name, 0.0) + time.perf_counter() - self.start
+
+class Profiler:
+    """
+    Collect the timers and counters of each frame, keeping the last history frames.
+    While it's disabled, timer gives a shared no-op context and count returns at once
+    """
+
+    FRAME = 'frame'
+
+    OVERLAY_COLOR = (255, 255, 255)
+    OVERLAY_BACKGROUND = (0, 0, 0)
+
+    def __init__(self, enabled: bool=False, history: int=300) -> None:
+        self.enabled = enabled
+
+        # Seconds of the timers, converted to milliseconds by end_frame, and values of the
+        # counters of the current frame
+        self.timers: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+
+        self.frames: Deque[Dict[str, Union[int, float]]] = deque(maxlen=history)
+        self._frame_start: Union[float, None] = None
+
+    def toggle(self) -> None:
+        """Enable or disable the profiler, the frames of the last run are kept"""
+
+        self.enabled = not self.enabled
+        self.timers.clear()
+        self.counters.clear()
+        self._frame_start = None
+
+    def timer(self, name: str):
+        """Context manager that adds the time spent in it to the timer name"""
+
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def count(self, name: str, amount: int=1) -> None:
+        """Add amount to the counter name"""
+
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def merge(self, timers: Dict[str, float], counters: Dict[str, int]) -> None:
+        """Add the timers and counters of another profiler, like one of a thread, to the frame"""
+
+        if not self.enabled:
+            return
+
+        for name, seconds in timers.items():
+            self.timers[name] = self.timers.get(name, 0.0) + seconds
+        for name, amount in counters.items():
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def start_frame(self) -> None:
+        """Start measuring a frame"""
+
+        if self.enabled:
+            self._frame_start = time.perf_counter()
+
+    def end_frame(self) -> None:
+        """Save the timers and counters of the frame in the log, and reset them"""
+
+        if not self.enabled:
+            return
+
+        # A frame where the profiler was enabled is incomplete, it isn't saved
+        if self._frame_start is not None:
+            frame: Dict[str, Union[int, float]] = {
+                self.FRAME: (time.perf_counter() - self._frame_start) * 1000
+            }
+            frame.update((name, seconds * 1000) for name, seconds in self.timers.items())
+            frame.update(self.counters)
+            self.frames.append(frame)
+
+        self.timers = {}
+        self.counters = {}
+        self._frame_start = None
+
+    def columns(self) -> List[str]:
+        """Names of the timers and counters in the log, the frame time first"""
+
+        columns: Dict[str, None] = {self.FRAME: None}
+        for frame in self.frames:
+            columns.update(dict.fromkeys(frame))
+        return list(columns)
+
+    def export(self, path: str) -> None:
+        """Save the log as CSV, one row by frame, the times are in milliseconds"""
+
+        with open(path, 'w', encoding='utf-8', newline='') as output:
+            writer = csv.DictWriter(output, fieldnames=self.columns(), restval=0)
+            writer.writeheader()
+            writer.writerows(self.frames)
+
+    def summary(self) -> List[str]:
+        """Lines with the value in the last frame and the average in the log of each column"""
+
+        if not self.frames:
+            return ['profiling, no frames yet']
+
+        last = self.frames[-1]
+        lines = [f'{"":<16} {"last":>9} {"average":>9}']
+
+        for name in self.columns():
+            average = sum(frame.get(name, 0) for frame in self.frames) / len(self.frames)
+            lines.append(f'{name:<16} {last.get(name, 0):9.2f} {average:9.2f}')
+
+        return lines
+
+    def draw_overlay(self, canvas: pygame.Surface, font: pygame.font.Font) -> pygame.Rect:
+        """
+        Draw the summary in the top right corner of canvas, returning the area changed.
+        The columns are only added, so the overlay covers the overlay of the last frame
+        """
+
+        texts = [font.render(line, True, self.OVERLAY_COLOR) for line in self.summary()]
+        width = max(text.get_width() for text in texts) + 20
+        height = sum(text.get_height() for text in texts) + 20
+
+        overlay = pygame.Surface((width, height))
+        overlay.fill(self.OVERLAY_BACKGROUND)
+
+        text_y = 10
+        for text in texts:
+            overlay.blit(text, (10, text_y))
+            text_y += text.get_height()
+
+        area = pygame.Rect(canvas.get_width() - width - 10, 10, width, height)
+        canvas.blit(overlay, area)
+        return area
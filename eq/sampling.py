@@ -0,0 +1,74 @@
+"""Adaptive sampling of curves, refining only where the curve isn't straight"""
+
+from typing import Callable, Tuple
+import numpy
+
+INITIAL_SAMPLES = 64
+TOLERANCE = 0.5
+MAX_DEPTH = 10
+
+def adaptive_sample(function: Callable[[numpy.ndarray], numpy.ndarray], start: float, \
+                    stop: float, visible: Tuple[float, float], tolerance: float=TOLERANCE, \
+                    initial_samples: int=INITIAL_SAMPLES, max_depth: int=MAX_DEPTH \
+                    ) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Sample the function between start and stop, everything in pixels. An interval is
+    subdivided while the middle point deviates more than tolerance from the straight
+    segment, or while it crosses the border of the function domain. Intervals entirely
+    above or below the visible range are not refined. Each subdivision level is evaluated
+    in a single pass. Poles are returned as NaN, so the curve is broken there
+    """
+
+    x_values = numpy.linspace(start, stop, initial_samples + 1)
+    y_values = _evaluate(function, x_values)
+
+    samples_x, samples_y = [x_values], [y_values]
+
+    left_x, right_x = x_values[:-1], x_values[1:]
+    left_y, right_y = y_values[:-1], y_values[1:]
+
+    for depth in range(max_depth + 1):
+        if len(left_x) == 0:
+            break
+
+        middle_x = (left_x + right_x) / 2
+        middle_y = _evaluate(function, middle_x)
+
+        samples_x.append(middle_x)
+        samples_y.append(middle_y)
+
+        with numpy.errstate(invalid='ignore'):
+            deviation = numpy.abs(middle_y - (left_y + right_y) / 2)
+            hidden = ((left_y < visible[0]) & (middle_y < visible[0]) & (right_y < visible[0])) \
+                   | ((left_y > visible[1]) & (middle_y > visible[1]) & (right_y > visible[1]))
+
+        finite = numpy.isfinite(numpy.stack((left_y, middle_y, right_y)))
+        domain_border = finite.any(axis=0) & ~finite.all(axis=0)
+
+        refine = ((deviation > tolerance) & ~hidden) | domain_border
+
+        if depth == max_depth:
+            # Still bending after all subdivisions: if the middle point is out of the
+            # endpoints range, there is a pole
+            with numpy.errstate(invalid='ignore'):
+                pole = refine & ((middle_y > numpy.maximum(left_y, right_y)) \
+                                 | (middle_y < numpy.minimum(left_y, right_y)))
+
+            samples_y[-1] = numpy.where(pole, numpy.nan, middle_y)
+            break
+
+        left_x, right_x = numpy.concatenate((left_x[refine], middle_x[refine])), \
+                          numpy.concatenate((middle_x[refine], right_x[refine]))
+        left_y, right_y = numpy.concatenate((left_y[refine], middle_y[refine])), \
+                          numpy.concatenate((middle_y[refine], right_y[refine]))
+
+    x_values = numpy.concatenate(samples_x)
+    y_values = numpy.concatenate(samples_y)
+
+    order = numpy.argsort(x_values, kind='stable')
+    return x_values[order], y_values[order]
+
+def _evaluate(function: Callable[[numpy.ndarray], numpy.ndarray], x_values: numpy.ndarray):
+    with numpy.errstate(all='ignore'):
+        y_values = numpy.asarray(function(x_values), dtype=float)
+    return numpy.broadcast_to(y_values, x_values.shape)
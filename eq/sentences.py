@@ -1,6 +1,11 @@
 """This script handle the sentences and the parsers"""
 
-from typing import List, Union
+import collections
+import concurrent.futures
+import itertools
+import os
+from typing import Callable, Dict, Iterable, Iterator, List, Set, Tuple, Union
+from . import optimizer
 from . import parser
 
 class Sentence:
@@ -10,9 +15,17 @@ class Sentence:
 
         self.ast: Union[parser.GenericNode, None] = None
         self.parsed = False
+        self.parser = parser.IncrementalParser()
+        self.optimizer = optimizer.IncrementalOptimizer()
 
         self.error_data: Union[parser.ErrorData, bool] = False
 
+        # What the sentence contributed to the interpreter in the last interpretation
+        self.dirty = False
+        self.name: Union[str, None] = None
+        self.value: Union[parser.GenericValue, None] = None
+        self.slot: Union[int, None] = None
+
     def __str__(self):
         return self.sentence
 
@@ -26,46 +39,159 @@ class Sentence:
     def append(self, content, index):
         """Add chars of content in index."""
 
+        index = min(index, len(self.sentence))
+
         self.sentence = self.sentence[:index] + content + self.sentence[index:]
+        self.parser.edit(index, index, len(content))
         self.parsed = False
         self.ast = None
+        self.dirty = True
 
     def pop(self, index=None):
         """Remove char of index, default index is the last char."""
 
         if index is None:
-            self.sentence = self.sentence[:-1]
-        else:
+            index = len(self.sentence) - 1
+
+        if 0 <= index < len(self.sentence):
             self.sentence = self.sentence[:index] + self.sentence[index+1:]
+            self.parser.edit(index, index + 1, 0)
         self.parsed = False
         self.ast = None
+        self.dirty = True
 
     def set(self, sentence: str):
         """Define new sentence and parse it"""
         self.sentence = sentence
+        self.parser.reset()
+        self.optimizer.reset()
         self.parsed = False
+        self.dirty = True
 
     def parse_ast(self):
         """Parse the sentence"""
 
         if not self.parsed:
             self.parsed = True
+            self.dirty = True
 
             if self.sentence != '':
-                lexer = parser.Lexer(self.sentence)
-
                 try:
-                    gen_tokens = lexer.make_tokens()
-                    parsed = parser.Parser(gen_tokens)
-                    ast = parsed.parse_sentence()
+                    ast = self.parser.parse(self.sentence)
                 except (parser.InvalidSyntaxError, parser.IllegalCharError) as error:
                     self.error_data = error.get_error_data()
                     print(self.error_data)
                     return
 
-                self.ast = ast
+                self.ast = self.optimizer.optimize(ast, self.parser.groups)
                 self.error_data = False
 
+    def set_parsed(self, ast: Union[parser.GenericNode, None], \
+                   error_data: Union[parser.ErrorData, bool]):
+        """Set the result of parsing the sentence somewhere else, like in another process"""
+
+        self.parsed = True
+        self.dirty = True
+        self.ast = ast
+        self.error_data = error_data
+
+        if error_data is not False:
+            print(error_data)
+
+# The packed ASTs of some lines, the index of the root or None of each line, and its errors
+ParsedLines = Tuple[parser.PackedAST, List[Union[int, None]], List[Union[parser.ErrorData, bool]]]
+
+def parse_lines(lines: List[str]) -> ParsedLines:
+    """
+    Parse and optimize each line, for a worker process: the ASTs are packed together,
+    so they are sent back without pickling a tree of objects for each line
+    """
+
+    packed = parser.PackedAST()
+    roots: List[Union[int, None]] = []
+    errors: List[Union[parser.ErrorData, bool]] = []
+
+    for line in lines:
+        root, error_data = None, False
+
+        if line != '':
+            try:
+                ast = parser.PrattParser(parser.Lexer(line).make_tokens()).parse_sentence()
+                root = packed.pack(optimizer.optimize(ast))
+            except (parser.InvalidSyntaxError, parser.IllegalCharError) as error:
+                error_data = error.get_error_data()
+
+        roots.append(root)
+        errors.append(error_data)
+
+    return packed, roots, errors
+
+def parse_parallel(lines: Iterable[str], workers: Union[int, None]=None, \
+                   chunk_size: int=1000) -> Iterator[Sentence]:
+    """
+    Get the parsed sentences of lines, in order. The lines are read in chunks, parsed
+    by a pool of workers processes, one by CPU if workers is None. Only a few chunks
+    are parsed ahead, so lines can be a file read as a stream
+    """
+
+    chunks = _chunks(lines, chunk_size)
+    workers = workers or os.cpu_count() or 1
+
+    # Starting the processes costs more than parsing a single chunk
+    head = list(itertools.islice(chunks, 2))
+
+    if workers == 1 or len(head) < 2:
+        for chunk in itertools.chain(head, chunks):
+            for line in chunk:
+                sentence = Sentence(line)
+                sentence.parse_ast()
+                yield sentence
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        pending: 'collections.deque[Tuple[List[str], concurrent.futures.Future]]' = \
+            collections.deque()
+
+        for chunk in itertools.chain(head, chunks):
+            pending.append((chunk, executor.submit(parse_lines, chunk)))
+
+            if len(pending) > 2 * workers:
+                yield from _parsed_sentences(*pending.popleft())
+
+        while pending:
+            yield from _parsed_sentences(*pending.popleft())
+
+def _chunks(lines: Iterable[str], chunk_size: int) -> Iterator[List[str]]:
+    """Split lines in lists of chunk_size lines, without the line breaks"""
+
+    lines = iter(lines)
+
+    while True:
+        chunk = [line.rstrip('\r\n') for line in itertools.islice(lines, chunk_size)]
+        if not chunk:
+            return
+        yield chunk
+
+def _parsed_sentences(chunk: List[str], future: concurrent.futures.Future \
+                      ) -> Iterator[Sentence]:
+    """Create the sentences of chunk, with the results of its parsing"""
+
+    packed, roots, errors = future.result()
+    nodes = packed.unpack()
+
+    for line, root, error_data in zip(chunk, roots, errors):
+        sentence = Sentence(line)
+        sentence.set_parsed(None if root is None else nodes[root], error_data)
+        yield sentence
+
+def _slot_order(sentence: Sentence) -> int:
+    """Get the anonymous slot of sentence, -1 if it hasn't an anonymous value"""
+
+    return -1 if sentence.slot is None else sentence.slot
+
+# Changed sentences from which their positions are found in one scan of the document
+BULK_SENTENCES = 8
+
 class Universe:
     """Universe instance, handle the sentences."""
 
@@ -74,16 +200,56 @@ class Universe:
         self.selected: int = 0
         self.interpreter = parser.Interpreter()
 
+        # Incremented each time the interpreter changes
+        self.version = 0
+
+        # The changed sentences, a dict so they are interpreted in the order they changed
+        self._pending: Dict[Sentence, None] = {}
+        self._removed: List[Sentence] = []
+        self._definitions: Dict[str, List[Sentence]] = {}
+
+        # The sentences of the anonymous values, in the order of the document
+        self._anonymous: List[Sentence] = []
+
+        # Error data of the sentences whose values went over the evaluation budget
+        self._evaluation_errors: Dict[Sentence, parser.ErrorData] = {}
+
     def __iter__(self):
         yield from self.sentences
 
     def __len__(self):
         return len(self.sentences)
 
+    def load(self, lines: Iterable[str], workers: Union[int, None]=1):
+        """
+        Replace the sentences by lines, parsing and interpreting all of them in one pass.
+        The lines are parsed by workers processes, one by CPU if workers is None
+        """
+
+        self.replace(list(parse_parallel(lines, workers)))
+
+    def load_file(self, path: str, workers: Union[int, None]=None):
+        """Replace the sentences by the lines of the file of path, read as a stream"""
+
+        with open(path, encoding='utf-8') as document:
+            self.load(document, workers)
+
+    def replace(self, new_sentences: List[Sentence]):
+        """Replace the sentences by new_sentences, already parsed, and interpret them"""
+
+        self._removed.extend(self.sentences)
+
+        self.sentences = new_sentences or [Sentence()]
+        self.selected = 0
+
+        self._pending.update(dict.fromkeys(self.sentences))
+        self.interpret_asts()
+
     def select(self, index: int):
         """Set selected sentence by index. If unexpected index, nothing happens."""
 
         if 0 <= index < len(self):
+            self._pending[self.get_selected()] = None
             self.selected = index
 
     def get_selected(self):
@@ -95,7 +261,7 @@ class Universe:
         """Pop the selected sentence, if it only have one sentence nothing happens"""
 
         if len(self.sentences) != 1:
-            self.sentences.pop(self.selected)
+            self._removed.append(self.sentences.pop(self.selected))
 
             if self.selected != 0:
                 self.selected -= 1
@@ -112,6 +278,9 @@ class Universe:
         """
 
         if self.selected != len(self)-1:
+            self._removed.append(self.sentences[self.selected])
+            self._removed.append(self.sentences[self.selected +1])
+
             self.sentences[self.selected] += self.sentences[self.selected +1]
             self.sentences.pop(self.selected +1)
 
@@ -130,12 +299,138 @@ class Universe:
         self.sentences.insert(self.selected, Sentence(after_index))
 
     def interpret_asts(self):
-        """Generates an interpreter and interpreter the ast's"""
-        self.interpreter.clear()
+        """
+        Interpret the ast's of the changed sentences. The values of the other sentences
+        are kept, the interpreter only invalidates what depends on the changed ones
+        """
+
+        changed_names: Set[str] = set()
+        changed = bool(self._removed)
+
+        # From the last anonymous slot, so each removal doesn't renumber the removed ones
+        for sentence in sorted(self._removed, key=_slot_order, reverse=True):
+            self._retract(sentence, changed_names)
+            self._pending.pop(sentence, None)
+        self._removed = []
+
+        self._pending[self.get_selected()] = None
+        dirty = [sentence for sentence in self._pending if sentence.dirty]
+        self._pending = {}
+
+        # A single scan of the document finds many sentences faster than a scan by sentence
+        if len(dirty) > BULK_SENTENCES:
+            position = {sentence: index for index, sentence in enumerate(self.sentences)}.get
+        else:
+            position = self.sentences.index
+
+        for sentence in dirty:
+            self._interpret(sentence, changed_names, position)
+            changed = True
+
+        for name in changed_names:
+            self._resolve(name)
+
+        if changed:
+            self.version += 1
+
+    def report_errors(self, errors: Dict[parser.GenericValue, parser.ErrorData]):
+        """
+        Show the errors of the values that went over the evaluation budget in their
+        sentences, replacing the errors reported before that weren't changed since
+        """
+
+        for sentence, error_data in self._evaluation_errors.items():
+            if sentence.error_data is error_data:
+                sentence.error_data = False
+        self._evaluation_errors = {}
+
+        if not errors:
+            return
+
         for sentence in self.sentences:
-            if sentence.ast is not None:
-                try:
-                    self.interpreter.parse_ast(sentence.ast)
-                except parser.ReservedVariableNameError as error:
-                    sentence.error_data = error.get_error_data()
-                    continue
+            if sentence.value is not None and sentence.value in errors and \
+                sentence.error_data is False:
+                sentence.error_data = errors[sentence.value]
+                self._evaluation_errors[sentence] = sentence.error_data
+
+    def _interpret(self, sentence: Sentence, changed_names: Set[str], \
+                   position: Callable[[Sentence], int]):
+        sentence.dirty = False
+        name, value = None, None
+
+        if sentence.ast is not None:
+            try:
+                name, value = self.interpreter.interpret(sentence.ast)
+            except (parser.ReservedVariableNameError, parser.EvaluationBudgetError) as error:
+                sentence.error_data = error.get_error_data()
+
+        if sentence.slot is not None and name is None and value is not None:
+            # Update the anonymous value in place
+            self.interpreter.vars[self.interpreter.NO_NAME_VARNAME][sentence.slot] = value
+            sentence.value = value
+            return
+
+        self._retract(sentence, changed_names)
+        sentence.name, sentence.value = name, value
+
+        if name is not None:
+            self._definitions.setdefault(name, []).append(sentence)
+            changed_names.add(name)
+        elif value is not None:
+            self._insert_anonymous(sentence, position)
+
+    def _retract(self, sentence: Sentence, changed_names: Set[str]):
+        """Remove the contribution of sentence to the interpreter"""
+
+        if sentence.name is not None:
+            self._definitions[sentence.name].remove(sentence)
+            changed_names.add(sentence.name)
+
+        elif sentence.slot is not None:
+            anonymous_values = self.interpreter.vars[self.interpreter.NO_NAME_VARNAME]
+            del self._anonymous[sentence.slot]
+            del anonymous_values[sentence.slot]
+
+            for moved in self._anonymous[sentence.slot:]:
+                moved.slot -= 1
+
+        sentence.name, sentence.value, sentence.slot = None, None, None
+
+    def _insert_anonymous(self, sentence: Sentence, position: Callable[[Sentence], int]):
+        """Insert the value of sentence between the anonymous values of its neighbours"""
+
+        index = position(sentence)
+        low, high = 0, len(self._anonymous)
+
+        while low < high:
+            middle = (low + high) // 2
+
+            if position(self._anonymous[middle]) < index:
+                low = middle + 1
+            else:
+                high = middle
+
+        self._anonymous.insert(low, sentence)
+        self.interpreter.vars[self.interpreter.NO_NAME_VARNAME].insert(low, sentence.value)
+        sentence.slot = low
+
+        for moved in self._anonymous[low + 1:]:
+            moved.slot += 1
+
+    def _resolve(self, name: str):
+        """Define the variable with the value of the last sentence that defines it"""
+
+        definitions = self._definitions.get(name)
+
+        if not definitions:
+            self._definitions.pop(name, None)
+            self.interpreter.undefine(name)
+            return
+
+        if len(definitions) == 1:
+            sentence = definitions[0]
+        else:
+            sentence = max(definitions, key=self.sentences.index)
+
+        if self.interpreter.vars.get(name) is not sentence.value:
+            self.interpreter.define(name, sentence.value)
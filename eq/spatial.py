@@ -0,0 +1,144 @@
+"""Spatial index of points, to find the points in a rectangle without testing all of them"""
+
+import math
+from typing import List, Tuple, Union
+import numpy
+
+POINTS_BY_CELL = 4
+DENSITY_CELLS = 1024
+
+class PointIndex:
+    """
+    Uniform grid over the bounding box of the points. The points are sorted by their
+    cell, row by row, so the cells of a row in a rectangle are a single range of points
+    """
+
+    def __init__(self, points: numpy.ndarray, points_by_cell: int=POINTS_BY_CELL) -> None:
+        points = numpy.asarray(points, dtype=float).reshape(-1, 2)
+        points = points[numpy.isfinite(points).all(axis=1)]
+
+        self.cells = max(1, int(math.sqrt(len(points) / points_by_cell)))
+        self._pyramid: Union['DensityPyramid', None] = None
+
+        if len(points) == 0:
+            self.minimum = self.cell_size = numpy.ones(2)
+            self.points = points
+            self.starts = numpy.zeros(2, dtype=int)
+            return
+
+        self.minimum = points.min(axis=0)
+        extent = points.max(axis=0) - self.minimum
+        self.cell_size = numpy.where(extent > 0, extent / self.cells, 1)
+
+        column, row = self._cell(points).T
+        cells = row * self.cells + column
+        order = numpy.argsort(cells, kind='stable')
+
+        self.points = points[order]
+
+        # The points of the cell i are points[starts[i]:starts[i + 1]]
+        self.starts = numpy.searchsorted(cells[order], numpy.arange(self.cells ** 2 + 1))
+
+    def __len__(self):
+        return len(self.points)
+
+    def _cell(self, points: numpy.ndarray) -> numpy.ndarray:
+        """Get the column and the row of the cells of points, clipped to the grid"""
+
+        cell = numpy.floor((points - self.minimum) / self.cell_size)
+        return numpy.clip(cell, 0, self.cells - 1).astype(int)
+
+    def query(self, x_min: float, x_max: float, y_min: float, y_max: float) -> numpy.ndarray:
+        """Get the points inside the rectangle, only the cells that overlap it are read"""
+
+        if len(self.points) == 0:
+            return self.points
+
+        (column_min, row_min), (column_max, row_max) = self._cell(
+            numpy.array(((x_min, y_min), (x_max, y_max)))
+        )
+
+        ranges = [
+            self.points[self.starts[row * self.cells + column_min]: \
+                        self.starts[row * self.cells + column_max + 1]] \
+            for row in range(row_min, row_max + 1)
+        ]
+        candidates = numpy.concatenate(ranges)
+
+        # The border cells are partially outside, and the clipped cells entirely
+        inside = (x_min <= candidates[:, 0]) & (candidates[:, 0] <= x_max) & \
+            (y_min <= candidates[:, 1]) & (candidates[:, 1] <= y_max)
+        return candidates[inside]
+
+    def pyramid(self) -> 'DensityPyramid':
+        """Get the density pyramid of the points, it's built in the first call"""
+
+        if self._pyramid is None:
+            self._pyramid = DensityPyramid(self.points)
+        return self._pyramid
+
+class DensityPyramid:
+    """
+    Counts of points in a square grid over their bounding box, and in coarser grids with
+    half the cells by side, down to a single cell. A view is read from the level with
+    cells of about a pixel, so zooming and panning don't count the points again
+    """
+
+    def __init__(self, points: numpy.ndarray, cells: int=DENSITY_CELLS) -> None:
+        if cells & (cells - 1):
+            raise ValueError('The cells by side must be a power of 2')
+
+        points = numpy.asarray(points, dtype=float).reshape(-1, 2)
+
+        if len(points) == 0:
+            self.minimum = numpy.zeros(2)
+            self.cell_size = 1.0
+        else:
+            self.minimum = points.min(axis=0)
+            extent = float((points.max(axis=0) - self.minimum).max())
+            self.cell_size = extent / cells if extent > 0 else 1.0
+
+        column, row = numpy.clip(numpy.floor((points - self.minimum) / self.cell_size), \
+                                 0, cells - 1).astype(int).T
+
+        # Indexed by [row, column], the rows go up like the y of the points
+        self.levels: List[numpy.ndarray] = [
+            numpy.bincount(row * cells + column, minlength=cells * cells).reshape(cells, cells)
+        ]
+
+        while len(self.levels[-1]) > 1:
+            half = len(self.levels[-1]) // 2
+            self.levels.append(self.levels[-1].reshape((half, 2, half, 2)).sum(axis=(1, 3)))
+
+        self.peaks = [int(level.max()) for level in self.levels]
+
+    def window(self, x_min: float, x_max: float, y_min: float, y_max: float, \
+               pixel_size: float) -> Tuple[int, numpy.ndarray, Tuple[float, float, float, float]]:
+        """
+        Get the counts of the cells that overlap the rectangle, in the finest level with
+        cells of at least pixel_size, the level and the rectangle covered by the cells
+        """
+
+        level, cell_size = 0, self.cell_size
+
+        while level + 1 < len(self.levels) and cell_size < pixel_size:
+            level += 1
+            cell_size *= 2
+
+        counts = self.levels[level]
+        cells = len(counts)
+
+        def cell_range(start: float, end: float, minimum: float) -> Tuple[int, int]:
+            first = math.floor((start - minimum) / cell_size)
+            last = math.ceil((end - minimum) / cell_size)
+            return min(max(first, 0), cells), min(max(last, 0), cells)
+
+        column_start, column_end = cell_range(x_min, x_max, self.minimum[0])
+        row_start, row_end = cell_range(y_min, y_max, self.minimum[1])
+
+        area = (self.minimum[0] + column_start * cell_size, \
+                self.minimum[0] + column_end * cell_size, \
+                self.minimum[1] + row_start * cell_size, \
+                self.minimum[1] + row_end * cell_size)
+
+        return level, counts[row_start:row_end, column_start:column_end], area
@@ -0,0 +1,84 @@
+"""Cache of rendered texts, so unchanged texts aren't rasterized again in each frame"""
+
+from collections import OrderedDict
+from typing import Dict, Tuple, Union
+import pygame
+from . import profiling
+
+class TextCache:
+    """Render texts of a font, keeping the last max_size surfaces (LRU eviction)"""
+
+    def __init__(self, font: pygame.font.Font, max_size: int=512, \
+                 profiler: Union[profiling.Profiler, None]=None) -> None:
+        self.font = font
+        self.max_size = max_size
+        self.profiler = profiler or profiling.Profiler()
+
+        self._surfaces: 'OrderedDict[Tuple[str, bool, object], pygame.Surface]' = OrderedDict()
+        self._advances: Dict[str, int] = {}
+        self._widths: 'OrderedDict[str, int]' = OrderedDict()
+
+        # The advances of the glyphs only add up to the width of a text in monospace fonts,
+        # SysFont falls back to a proportional font when there isn't a monospace one
+        self.monospace = font.size('iiii')[0] == font.size('WWWW')[0]
+
+    def __len__(self):
+        return len(self._surfaces)
+
+    def render(self, text: str, antialias: bool, color) -> pygame.Surface:
+        """Get the rendered text, rendering it only if it isn't in the cache"""
+
+        key = (text, antialias, color)
+        surface = self._surfaces.get(key)
+
+        if surface is not None:
+            self._surfaces.move_to_end(key)
+            return surface
+
+        self.profiler.count('font.render')
+        surface = self.font.render(text, antialias, color)
+        self._surfaces[key] = surface
+
+        if len(self._surfaces) > self.max_size:
+            self._surfaces.popitem(last=False)
+
+        return surface
+
+    def width(self, text: str) -> int:
+        """
+        Get the width of text without rendering it. In monospace fonts it's the sum of the
+        cached advances of its glyphs, in the others the width measured by the font,
+        keeping the last max_size widths (LRU eviction)
+        """
+
+        if not self.monospace:
+            width = self._widths.get(text)
+
+            if width is not None:
+                self._widths.move_to_end(text)
+                return width
+
+            width = self._widths[text] = self.font.size(text)[0]
+
+            if len(self._widths) > self.max_size:
+                self._widths.popitem(last=False)
+
+            return width
+
+        advances = self._advances
+        width = 0
+
+        for char in text:
+            if char not in advances:
+                metrics = self.font.metrics(char)[0]
+                advances[char] = metrics[4] if metrics is not None else self.font.size(char)[0]
+            width += advances[char]
+
+        return width
+
+    def clear(self) -> None:
+        """Remove all cached surfaces, advances and widths"""
+
+        self._surfaces.clear()
+        self._advances.clear()
+        self._widths.clear()
@@ -0,0 +1,80 @@
+"""Cache of rendered tiles of the graph, so panning and zooming blit them instead of drawing"""
+
+import math
+from collections import OrderedDict
+from typing import Tuple, Union
+import pygame
+
+# Zoom level, column and row of the tile, the universe version drawn in it,
+# and if its dots were drawn as a heatmap
+TileKey = Tuple[int, int, int, int, bool]
+
+class TileCache:
+    """
+    Square tiles of SIZE pixels in the graph coordinates, drawn at discrete zoom levels:
+    the scale of the level n is base_scale * 2 ** (n / LEVELS_BY_OCTAVE). The tile (i, j)
+    of a level covers its pixels from (i * SIZE, j * SIZE), counted from the graph origin
+    with y going down. It keeps the last used tiles up to max_bytes (LRU eviction)
+    """
+
+    SIZE = 256
+    LEVELS_BY_OCTAVE = 8
+
+    def __init__(self, max_bytes: int=64 * 2 ** 20, base_scale: float=100) -> None:
+        self.max_bytes = max_bytes
+        self.base_scale = base_scale
+
+        self.nbytes = 0
+        self._tiles: 'OrderedDict[TileKey, pygame.Surface]' = OrderedDict()
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def __contains__(self, key: TileKey) -> bool:
+        return key in self._tiles
+
+    def level_scale(self, level: int) -> float:
+        """Get the scale of the zoom level"""
+
+        return self.base_scale * 2 ** (level / self.LEVELS_BY_OCTAVE)
+
+    def nearest_level(self, scale: float) -> int:
+        """Get the zoom level with the nearest scale"""
+
+        return round(math.log2(scale / self.base_scale) * self.LEVELS_BY_OCTAVE)
+
+    def level(self, scale: float) -> Union[int, None]:
+        """Get the zoom level of scale, None if scale isn't the scale of a level"""
+
+        level = self.nearest_level(scale)
+        return level if math.isclose(self.level_scale(level), scale) else None
+
+    def get(self, key: TileKey) -> Union[pygame.Surface, None]:
+        """Get the tile of key, None if it isn't in the cache"""
+
+        tile = self._tiles.get(key)
+
+        if tile is not None:
+            self._tiles.move_to_end(key)
+        return tile
+
+    def put(self, key: TileKey, tile: pygame.Surface) -> None:
+        """Add the tile of key, evicting the least recently used ones over max_bytes"""
+
+        if key in self._tiles:
+            self.nbytes -= _size(self._tiles.pop(key))
+
+        self._tiles[key] = tile
+        self.nbytes += _size(tile)
+
+        while self.nbytes > self.max_bytes and len(self._tiles) > 1:
+            self.nbytes -= _size(self._tiles.popitem(last=False)[1])
+
+    def clear(self) -> None:
+        """Remove all tiles"""
+
+        self._tiles.clear()
+        self.nbytes = 0
+
+def _size(tile: pygame.Surface) -> int:
+    return tile.get_width() * tile.get_height() * tile.get_bytesize()
@@ -0,0 +1,167 @@
+"""Regression tests of the interpreter, run with: python -m unittest discover tests"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+import numpy
+from eq import evaluation, parser, sentences
+
+CHAIN_LENGTH = 10_000
+
+def load(lines):
+    """Get a universe with the lines parsed and interpreted"""
+
+    universe = sentences.Universe()
+    universe.load(lines)
+    return universe
+
+def anonymous(universe: sentences.Universe, index: int=0) -> parser.GenericValue:
+    """Get the anonymous value of index"""
+
+    interpreter = universe.interpreter
+    return interpreter.vars[interpreter.NO_NAME_VARNAME][index]
+
+class TestVariableChain(unittest.TestCase):
+    """Long chains of definitions are evaluated without a Python frame by variable"""
+
+    def test_chain(self):
+        """A dot at the end of the chain is evaluated, and again after its head changes"""
+
+        lines = ['v0: 1'] + [f'v{index}: v{index - 1} + 1' for index in range(1, CHAIN_LENGTH)]
+        universe = load(lines + [f'(v{CHAIN_LENGTH - 1}, 1)'])
+        dot = anonymous(universe)
+
+        self.assertEqual(dot.get_value(universe.interpreter), (CHAIN_LENGTH, 1))
+
+        universe.sentences[0].set('v0: 5')
+        universe.parse_selected()
+        self.assertEqual(dot.get_value(universe.interpreter), (CHAIN_LENGTH + 4, 1))
+
+    def test_chain_of_arguments(self):
+        """A chain that uses x isn't cached, it's evaluated once by evaluation"""
+
+        lines = ['w0: x'] + [f'w{index}: w{index - 1} + 1' for index in range(1, CHAIN_LENGTH)]
+        universe = load(lines + [f'y: w{CHAIN_LENGTH - 1}'])
+
+        values = anonymous(universe).get_values(universe.interpreter, numpy.array([0.0, 1.0]))
+
+        self.assertEqual(values.tolist(), [CHAIN_LENGTH - 1, CHAIN_LENGTH])
+        self.assertEqual(universe.interpreter.cache, {})
+
+    def test_errors(self):
+        """The errors of the dependencies are raised where they are used"""
+
+        cases = {
+            parser.CircularDefinitionError: ['a: b', 'b: a', '(a, 1)'],
+            parser.UndefinedVariableError: ['a: b + 1', 'b: q', '(a, 1)'],
+            parser.EvaluationBudgetError: ['a: 9^9^9', 'b: a + 1', '(b, 1)']
+        }
+
+        for error, lines in cases.items():
+            universe = load(lines)
+
+            with self.assertRaises(error):
+                anonymous(universe).get_value(universe.interpreter)
+
+class TestAnonymousOrder(unittest.TestCase):
+    """The anonymous values follow the order of their sentences in the document"""
+
+    def assert_order(self, universe: sentences.Universe, expected):
+        """Check the dots of the anonymous values and the slots of their sentences"""
+
+        interpreter = universe.interpreter
+        values = interpreter.vars[interpreter.NO_NAME_VARNAME]
+
+        self.assertEqual([value.get_value(interpreter) for value in values], expected)
+        self.assertEqual([sentence.slot for sentence in universe if sentence.slot is not None], \
+                         list(range(len(expected))))
+
+    def test_edits(self):
+        """A new value is inserted between its neighbours, a removed one closes its slot"""
+
+        universe = load(['(1, 1)', 'a: 1', '(3, 3)', '(4, 4)'])
+
+        universe.select(1)
+        universe.split_selected(0)
+        universe.get_selected().set('(2, 2)')
+        universe.parse_selected()
+        self.assert_order(universe, [(1, 1), (2, 2), (3, 3), (4, 4)])
+
+        universe.select(0)
+        universe.pop_selected()
+        universe.parse_selected()
+        self.assert_order(universe, [(2, 2), (3, 3), (4, 4)])
+
+        universe.select(2)
+        universe.get_selected().set('b: 3')
+        universe.parse_selected()
+        self.assert_order(universe, [(2, 2), (4, 4)])
+
+class TestEvaluationBudget(unittest.TestCase):
+    """The budget is in node visits by evaluated point, not in nodes"""
+
+    def interpret(self, sentence: str) -> parser.GenericValue:
+        """Get the value of sentence"""
+
+        ast = parser.PrattParser(parser.Lexer(sentence).make_tokens()).parse_sentence()
+        return parser.Interpreter().interpret(ast)[1]
+
+    def test_long_dot(self):
+        """A long sum is evaluated in a single point, it's in the budget"""
+
+        dot = self.interpret('(' + ' + '.join(f'v{index}' for index in range(150_000)) + ', 1)')
+        self.assertIsInstance(dot, parser.DotValue)
+
+    def test_grid(self):
+        """An implicit curve too big to evaluate in each cell of the grid isn't evaluated"""
+
+        implicit = self.interpret(' + '.join(f'x*{index}' for index in range(10_000)) + ' = y')
+        interpreter = parser.Interpreter()
+        view = evaluation.Evaluator(interpreter, (600, 500), 50, (0, 0, 1200, 1000))
+
+        self.assertIsNone(view.implicit(implicit))
+        self.assertIn(implicit, view.errors)
+
+class TestUpdate(unittest.TestCase):
+    """A long-lived interpreter takes the variables of each version, keeping its cache"""
+
+    def test_update(self):
+        """Only the changed variables and their dependents are evaluated again"""
+
+        universe = load(['a: 1', 'b: a + 1', 'c: 10', 'd: c + b', '(d, 1)'])
+        interpreter = parser.Interpreter()
+        interpreter.update(universe.interpreter.copy())
+
+        self.assertEqual(anonymous(universe).get_value(interpreter), (12, 1))
+        self.assertEqual(set(interpreter.cache), {'a', 'b', 'c', 'd'})
+
+        universe.sentences[0].set('a: 5')
+        universe.select(0)
+        universe.parse_selected()
+        interpreter.update(universe.interpreter.copy())
+
+        self.assertEqual(set(interpreter.cache), {'c'})
+        self.assertEqual(anonymous(universe).get_value(interpreter), (16, 1))
+
+    def test_removed(self):
+        """A variable that isn't defined anymore isn't read from the cache"""
+
+        universe = load(['a: 1', '(a, 1)'])
+        interpreter = parser.Interpreter()
+        interpreter.update(universe.interpreter.copy())
+        anonymous(universe).get_value(interpreter)
+
+        universe.sentences[0].set('b: 2')
+        universe.select(0)
+        universe.parse_selected()
+        interpreter.update(universe.interpreter.copy())
+
+        with self.assertRaises(parser.UndefinedVariableError):
+            anonymous(universe).get_value(interpreter)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+"""Regression tests of the parser, run with: python -m unittest discover tests"""
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+import numpy
+from benchmarks import fuzz
+from eq import parser
+
+# Sentences of each seeded run of the fuzzers of benchmarks/fuzz.py
+FUZZ_CASES = 500
+
+class TestLeadingParenthesis(unittest.TestCase):
+    """A sentence that starts with a parenthesis is a dot only if a comma follows its expr"""
+
+    def parse(self, parser_class, sentence: str) -> parser.GenericValue:
+        """Get the value of sentence parsed by parser_class"""
+
+        ast = parser_class(parser.Lexer(sentence).make_tokens()).parse_sentence()
+        return parser.Interpreter().interpret(ast)[1]
+
+    def test_sentences(self):
+        """Both parsers keep parsing the relation after the ')' of the first group"""
+
+        for parser_class in (parser.Parser, parser.PrattParser):
+            circle = self.parse(parser_class, '(x-1)^2 + y^2 = 4')
+            values = circle.get_values(parser.Interpreter(), numpy.array([3.0, 1.0]), \
+                                       numpy.array([0.0, 2.0]))
+
+            self.assertIsInstance(circle, parser.ImplicitValue)
+            self.assertEqual(values.tolist(), [0, 0])
+
+            region = self.parse(parser_class, '(x) < y')
+
+            self.assertIsInstance(region, parser.RegionValue)
+            self.assertEqual(region.comparison, parser.TT_LT)
+
+            dot = self.parse(parser_class, '(1, 2)')
+
+            self.assertIsInstance(dot, parser.DotValue)
+            self.assertEqual(dot.get_value(parser.Interpreter()), (1, 2))
+
+            with self.assertRaises(parser.InvalidSyntaxError):
+                self.parse(parser_class, '(1, 2) + 3')
+
+class TestFuzz(unittest.TestCase):
+    """A short seeded run of each fuzzer, the long runs are in benchmarks/fuzz.py"""
+
+    def run_fuzz(self, target: str):
+        """Run FUZZ_CASES cases of the fuzzer of target, it raises on a difference"""
+
+        generator = random.Random(0)
+
+        for case in range(FUZZ_CASES):
+            fuzz.TARGETS[target](generator, case)
+
+    def test_incremental(self):
+        """IncrementalParser gives the same ASTs and errors as a parse from scratch"""
+        self.run_fuzz('incremental')
+
+    def test_optimizer(self):
+        """The optimized expressions give the same values and errors as the parsed ones"""
+        self.run_fuzz('optimizer')
+
+    def test_parser(self):
+        """PrattParser gives the same ASTs and errors as the recursive Parser"""
+        self.run_fuzz('parser')
+
+if __name__ == '__main__':
+    unittest.main()